@@ -0,0 +1,57 @@
+"""Compares sequential and concurrent `get_api_data` against a local stub of the ranked-products API.
+
+Run with `python -m benchmarks.bench_fetch` from the repository root.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.Stores.Uniqlo.uniqlo import get_api_data, get_categories
+
+LATENCY = 0.1
+"""Seconds the stub server waits before answering, standing in for a network round trip."""
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers every GET with an empty ranked-products page after `LATENCY` seconds."""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        time.sleep(LATENCY)
+        body = json.dumps({"result": {"items": []}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def time_fetch(url: str, max_workers: int) -> float:
+    start = time.perf_counter()
+    data = get_api_data(url=url, max_workers=max_workers)
+    elapsed = time.perf_counter() - start
+    assert [category for _, category in data] == [c for g in ("men", "women") for c in get_categories()[g].values()]
+    return elapsed
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/ranked-products"
+
+    try:
+        sequential = time_fetch(url, max_workers=1)
+        print(f"max_workers=1: {sequential:.2f}s")
+        for max_workers in (4, 8, 16):
+            elapsed = time_fetch(url, max_workers=max_workers)
+            print(f"max_workers={max_workers}: {elapsed:.2f}s ({sequential / elapsed:.1f}x)")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Compares peak memory and time of decoding a stored catalog whole with `unpack` against streaming it with
+`iter_unpack`, for packed rows and legacy indented JSON rows.
+
+Run with `python -m benchmarks.bench_load [items]` from the repository root.
+"""
+import json
+import sys
+import time
+import tracemalloc
+
+from benchmarks.synthetic import make_ranked_payload
+from src.Stores.Uniqlo.uniqlo import Uniqlo
+from utils.codec import iter_unpack, pack, unpack
+
+
+def measure(fn) -> tuple[float, int]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def consume(products) -> None:
+    for _ in products:
+        pass
+
+
+def main(n: int = 50_000):
+    uniqlo = Uniqlo()
+    uniqlo.raw_data = make_ranked_payload(n, duplicate_ratio=0)
+    catalog = uniqlo.dump_products(uniqlo.iter_products())
+    rows = {"packed": pack(catalog), "legacy": json.dumps(catalog, indent=2)}
+    del uniqlo, catalog
+
+    for name, data in rows.items():
+        assert list(iter_unpack(data)) == unpack(data)
+        whole = measure(lambda: consume(Uniqlo().load_data(data) or ()))
+        stream = measure(lambda: consume(Uniqlo().iter_load_data(data)))
+        print(f"{name:<7} {len(data) / 1e6:6.1f} MB row, {n} products")
+        print(f"  load_data       {whole[0]:6.2f} s  peak {whole[1] / 1e6:7.1f} MB")
+        print(f"  iter_load_data  {stream[0]:6.2f} s  peak {stream[1] / 1e6:7.1f} MB "
+              f"({whole[1] / stream[1]:.0f}x less)")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,50 @@
+"""Times `Uniqlo.parse_file` on a synthetic 100k-item payload against the previous list-based dedup.
+
+Run with `python -m benchmarks.bench_parse` from the repository root.
+"""
+import sys
+import time
+
+from benchmarks.synthetic import make_ranked_payload
+from src.Stores.Uniqlo.uniqlo import Uniqlo, parse_product
+from src.Stores.Uniqlo.uniqlo_pydantic_model import UniqloProduct
+
+
+def legacy_parse(data) -> list:
+    """The parse loop before the seen-set: validates every item and dedups against a list."""
+    unique_ids = []
+    products = []
+    for d, cat in data:
+        for item in d:
+            product = parse_product(UniqloProduct(**item), category=cat)
+            if product.store_product_id in unique_ids:
+                continue
+            unique_ids.append(product.store_product_id)
+            products.append(product)
+    return products
+
+
+def time_parse(data) -> tuple[float, int]:
+    uniqlo = Uniqlo()
+    uniqlo.raw_data = data
+    start = time.perf_counter()
+    uniqlo.parse_file()
+    return time.perf_counter() - start, len(uniqlo.products)
+
+
+def main(n: int = 100_000, legacy_n: int = 20_000):
+    data = make_ranked_payload(n)
+    elapsed, count = time_parse(data)
+    print(f"parse_file: {n} items -> {count} products in {elapsed:.2f}s ({n / elapsed:,.0f} items/s)")
+
+    legacy_data = make_ranked_payload(legacy_n)
+    elapsed, _ = time_parse(legacy_data)
+    start = time.perf_counter()
+    legacy_parse(legacy_data)
+    legacy_elapsed = time.perf_counter() - start
+    print(f"{legacy_n} items: parse_file {elapsed:.2f}s, list dedup {legacy_elapsed:.2f}s "
+          f"({legacy_elapsed / elapsed:.1f}x slower)")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
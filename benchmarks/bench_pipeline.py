@@ -0,0 +1,57 @@
+"""Compares the single-transaction commit with the pipelined commit, reading products from a packed catalog the way
+`commit catalog` does, into a throwaway SQLite database standing in for the remote one. SQLite takes one writer at a
+time, so extra writers only pay off against PostgreSQL; here the gain comes from reading while writing.
+
+Run with `python -m benchmarks.bench_pipeline [items]` from the repository root.
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.synthetic import make_ranked_payload
+from src.models.productsql import ProductSQL, ProductSizeSQL, migrate
+from src.Stores.Uniqlo.uniqlo import Uniqlo
+from utils.codec import pack
+
+
+def commit(catalog: bytes, writers: int) -> tuple[float, tuple]:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'remote.sqlite3'}", connect_args={"timeout": 60})
+        migrate(engine)
+        session_factory = sessionmaker(bind=engine)
+        uniqlo = Uniqlo()
+        start = time.perf_counter()
+        uniqlo.commit_products(uniqlo.iter_load_data(catalog), session_factory=session_factory, writers=writers)
+        elapsed = time.perf_counter() - start
+        with session_factory() as session:
+            counts = (session.scalar(select(func.count()).select_from(ProductSQL)),
+                      session.scalar(select(func.count()).select_from(ProductSizeSQL)))
+        engine.dispose()
+    return elapsed, counts
+
+
+def main(n: int = 20_000):
+    uniqlo = Uniqlo()
+    uniqlo.raw_data = make_ranked_payload(n, duplicate_ratio=0)
+    catalog = pack(uniqlo.dump_products(uniqlo.iter_products()))
+
+    start = time.perf_counter()
+    for _ in uniqlo.iter_load_data(catalog):
+        pass
+    print(f"reading the catalog alone: {time.perf_counter() - start:6.2f} s")
+
+    baseline, expected = commit(catalog, writers=0)
+    print(f"single transaction: {baseline:6.2f} s ({n / baseline:8,.0f} products/s)")
+    for writers in (1, 2, 4):
+        elapsed, counts = commit(catalog, writers=writers)
+        assert counts == expected, (counts, expected)
+        print(f"{writers} writer(s):        {elapsed:6.2f} s ({n / elapsed:8,.0f} products/s, "
+              f"{baseline / elapsed:.2f}x)")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
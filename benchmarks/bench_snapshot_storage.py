@@ -0,0 +1,53 @@
+"""Compares the legacy pretty-printed JSON rows with packed rows for a realistic store snapshot.
+
+Run with `python -m benchmarks.bench_snapshot_storage [items] [days]` from the repository root.
+"""
+import json
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic import make_ranked_payload
+from utils.codec import pack, unpack
+
+
+def best_of(fn, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(n: int = 6_000, days: int = 7):
+    snapshot = make_ranked_payload(n)
+    legacy = json.dumps(snapshot, indent=2)
+    packed = pack(snapshot)
+    assert unpack(legacy) == unpack(packed) == snapshot
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sizes, loads = {}, {}
+        for name, value in (("legacy", legacy), ("packed", packed)):
+            path = Path(tmp) / f"{name}.sqlite3"
+            with sqlite3.connect(path) as conn:
+                conn.execute("CREATE TABLE store (id INTEGER PRIMARY KEY, data BLOB)")
+                conn.executemany("INSERT INTO store (data) VALUES (?)", [(value,)] * days)
+            sizes[name] = path.stat().st_size
+
+            def load():
+                with sqlite3.connect(path) as conn:
+                    unpack(conn.execute("SELECT data FROM store WHERE id = ?", (days,)).fetchone()[0])
+            loads[name] = best_of(load)
+
+    print(f"{days} daily snapshots of {n} items")
+    for name in ("legacy", "packed"):
+        print(f"{name:<7} file {sizes[name] / 1e6:7.2f} MB, load one snapshot {loads[name] * 1000:6.1f} ms")
+    print(f"{sizes['legacy'] / sizes['packed']:.1f}x smaller on disk, load {loads['legacy'] / loads['packed']:.2f}x "
+          f"as fast, pack {best_of(lambda: pack(snapshot)) * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
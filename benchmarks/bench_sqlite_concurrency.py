@@ -0,0 +1,88 @@
+"""Measures how `show`-style reads fare while another process writes store snapshots, with SQLite's defaults
+(rollback journal) and with the pragmas of `utils.db_utils.configure_sqlite` (WAL).
+
+The writer process adds snapshot-sized rows in transactions that each take a while, like `add store`; the reader
+lists the latest stores in a loop and records how long every query takes. Run with
+`python -m benchmarks.bench_sqlite_concurrency [seconds] [row_mb]` from the repository root.
+"""
+import multiprocessing
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine, text
+
+from utils.db_utils import configure_sqlite
+
+SCHEMA = "CREATE TABLE store (id INTEGER PRIMARY KEY, brand TEXT, alias TEXT, data BLOB)"
+LIST_STORES = text("SELECT id, brand, alias FROM store ORDER BY id DESC LIMIT 50")
+
+
+def make_engine(path: Path, tuned: bool):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"timeout": 30})
+    return configure_sqlite(engine) if tuned else engine
+
+
+def write(path: str, tuned: bool, seconds: float, row_mb: float, ready) -> None:
+    """Adds one snapshot row per transaction, each split into several statements like `save_snapshot`."""
+    engine = make_engine(Path(path), tuned)
+    chunk = os.urandom(int(row_mb * 1e6 / 10))
+    ready.set()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        with engine.begin() as conn:
+            for _ in range(10):
+                conn.execute(text("INSERT INTO store (brand, alias, data) VALUES ('Uniqlo', 'nightly', :data)"),
+                             {"data": chunk})
+                time.sleep(0.005)
+    engine.dispose()
+
+
+def run(tuned: bool, seconds: float, row_mb: float) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "local.sqlite3"
+        engine = make_engine(path, tuned)
+        with engine.begin() as conn:
+            conn.exec_driver_sql(SCHEMA)
+
+        ready = multiprocessing.Event()
+        writer = multiprocessing.Process(target=write, args=(str(path), tuned, seconds, row_mb, ready))
+        writer.start()
+        ready.wait()
+
+        latencies, errors = [], 0
+        while writer.is_alive():
+            start = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    conn.execute(LIST_STORES).all()
+            except Exception as e:
+                if not isinstance(getattr(e, "orig", None), sqlite3.OperationalError):
+                    raise
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+        writer.join()
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT count(*) FROM store")).scalar()
+        engine.dispose()
+
+    latencies.sort()
+    return {"reads": len(latencies), "errors": errors, "rows_written": rows,
+            "p50": statistics.median(latencies), "p99": latencies[int(len(latencies) * 0.99)],
+            "max": latencies[-1]}
+
+
+def main(seconds: float = 5, row_mb: float = 2):
+    for name, tuned in (("default", False), ("tuned", True)):
+        r = run(tuned, seconds, row_mb)
+        print(f"{name:<8} reads {r['reads']:6} ({r['reads'] / seconds:7,.0f}/s)  errors {r['errors']:3}  "
+              f"p50 {r['p50'] * 1000:7.2f} ms  p99 {r['p99'] * 1000:7.2f} ms  max {r['max'] * 1000:7.1f} ms  "
+              f"writer rows {r['rows_written']}")
+
+
+if __name__ == '__main__':
+    main(*map(float, sys.argv[1:]))
@@ -0,0 +1,52 @@
+"""Measures CLI startup for local-only commands and checks that they never touch the remote database.
+
+Each command runs in a fresh interpreter, which reports its wall time, whether the remote engine was created and
+which heavy modules got imported. Run with `python -m benchmarks.bench_startup` from the repository root.
+"""
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+sys.argv = ["main.py", *{args!r}]
+import main
+try:
+    main.app()
+except SystemExit:
+    pass
+elapsed = time.perf_counter() - start
+import utils.db_utils as db_utils
+print(json.dumps({{
+    "elapsed": elapsed,
+    "remote_engine": db_utils.get_remote_engine.cache_info().currsize > 0,
+    "imported": [m for m in ("psycopg2", "dotenv", "requests", "pydantic", "src.Stores.Uniqlo.uniqlo")
+                 if m in sys.modules],
+}}))
+"""
+
+COMMANDS = [["--help"], ["show", "stores"], ["show", "catalog"]]
+
+
+def run(args: list) -> dict:
+    result = subprocess.run([sys.executable, "-c", CHILD.format(args=args)], cwd=ROOT, capture_output=True,
+                            text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(repeat: int = 5):
+    for args in COMMANDS:
+        runs = [run(args) for _ in range(repeat)]
+        best = min(r["elapsed"] for r in runs)
+        last = runs[-1]
+        print(f"{' '.join(args):<14} best of {repeat}: {best * 1000:6.0f} ms  "
+              f"remote engine: {last['remote_engine']}  heavy imports: {last['imported'] or 'none'}")
+        assert not last["remote_engine"], f"`{' '.join(args)}` created the remote engine"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""Compares items/sec of the trusted 'fast' and the fully validating 'strict' modes of `Uniqlo.iter_products`.
+
+Run with `python -m benchmarks.bench_validation [items]` from the repository root.
+"""
+import sys
+import time
+
+from benchmarks.synthetic import make_ranked_payload
+from src.Stores.Uniqlo.uniqlo import Uniqlo
+
+
+def parse(data, validation: str) -> tuple[float, list]:
+    uniqlo = Uniqlo(validation=validation)
+    uniqlo.raw_data = data
+    start = time.perf_counter()
+    products = list(uniqlo.iter_products())
+    return time.perf_counter() - start, products
+
+
+def main(n: int = 50_000):
+    data = make_ranked_payload(n, duplicate_ratio=0)
+    fast, fast_products = parse(data, 'fast')
+    strict, strict_products = parse(data, 'strict')
+    assert [p.model_dump(exclude_unset=True) for p in fast_products] == \
+           [p.model_dump(exclude_unset=True) for p in strict_products]
+
+    print(f"strict: {n / strict:10,.0f} items/s")
+    print(f"fast:   {n / fast:10,.0f} items/s ({strict / fast:.1f}x)")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
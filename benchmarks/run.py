@@ -0,0 +1,146 @@
+"""Offline benchmark suite for the parse -> serialize -> commit pipeline.
+
+Times `Uniqlo.parse_file`, `Store.get_json`, `Store.save_json`, `Store.add_product` and `Store.commit_products`
+(into a throwaway SQLite database, twice: first as inserts, then as unchanged rows) on synthetic ranked-products
+payloads, and writes the results to a JSON file. Pass a previous results file as `--baseline` to flag stages that
+got slower.
+
+Run with `python -m benchmarks.run [--sizes 1000 10000 100000] [--output FILE] [--baseline FILE]` from the
+repository root.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.synthetic import make_ranked_payload
+from src.models import store as store_module
+from src.models.productsql import migrate
+from src.Stores.Uniqlo.uniqlo import Uniqlo
+
+ROOT = Path(__file__).resolve().parent.parent
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+
+REGRESSION_THRESHOLD = 1.2
+"""A stage is reported as a regression when it takes this many times longer than in the baseline."""
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def timed_save_json(uniqlo: Uniqlo) -> float:
+    """Times `save_json`, then removes the files it wrote under the parser's data directory."""
+    brand_dir = Path(store_module.__file__).parent.parent / uniqlo.brand
+    existing = set(brand_dir.rglob('*'))
+    seconds = timed(uniqlo.save_json)
+    for path in sorted(set(brand_dir.rglob('*')) - existing, reverse=True):
+        path.unlink() if path.is_file() else path.rmdir()
+    if not existing:
+        brand_dir.rmdir()
+    return seconds
+
+
+def run_size(n: int) -> dict:
+    """Runs every stage on `n` synthetic items and returns each stage's seconds and items/s."""
+    data = make_ranked_payload(n)
+    uniqlo = Uniqlo()
+    uniqlo.raw_data = data
+    stages = {"parse_file": timed(uniqlo.parse_file)}
+    products = uniqlo.products
+
+    json_text = ""
+
+    def get_json():
+        nonlocal json_text
+        json_text = uniqlo.get_json()
+    stages["get_json"] = timed(get_json)
+
+    stages["save_json"] = timed_save_json(uniqlo)
+
+    stages["add_product"] = timed(lambda: [uniqlo.add_product(product) for product in products])
+    uniqlo.sqlproducts.clear()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'remote.sqlite3'}")
+        migrate(engine)
+        session_factory = sessionmaker(bind=engine)
+        stages["commit_products"] = timed(lambda: uniqlo.commit_products(session_factory=session_factory))
+        stages["commit_products_unchanged"] = timed(lambda: uniqlo.commit_products(session_factory=session_factory))
+        engine.dispose()
+
+    return {
+        "items": n,
+        "products": len(products),
+        "json_bytes": len(json_text.encode()),
+        "stages": {name: {"seconds": round(seconds, 4), "items_per_second": round(n / seconds) if seconds else None}
+                   for name, seconds in stages.items()},
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict) -> list[str]:
+    """Lists the stages that are `REGRESSION_THRESHOLD` times slower than the same stage and size in `baseline`."""
+    previous = {run["items"]: run["stages"] for run in baseline["runs"]}
+    regressions = []
+    for run in results["runs"]:
+        for name, stage in run["stages"].items():
+            old = previous.get(run["items"], {}).get(name)
+            if old and old["seconds"] and stage["seconds"] / old["seconds"] > REGRESSION_THRESHOLD:
+                regressions.append(f"{name} @ {run['items']}: {old['seconds']:.3f}s -> {stage['seconds']:.3f}s "
+                                   f"({stage['seconds'] / old['seconds']:.2f}x)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--output", type=Path, default=ROOT / "benchmark_results.json")
+    parser.add_argument("--baseline", type=Path, default=None)
+    args = parser.parse_args()
+
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": [],
+    }
+    for n in args.sizes:
+        run = run_size(n)
+        results["runs"].append(run)
+        print(f"{n} items, {run['products']} products")
+        for name, stage in run["stages"].items():
+            print(f"  {name:<26} {stage['seconds']:8.3f} s {stage['items_per_second'] or 0:12,} items/s")
+
+    args.output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {args.output}")
+
+    if args.baseline is not None:
+        regressions = compare(results, json.loads(args.baseline.read_text()))
+        for line in regressions:
+            print(f"Regression: {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
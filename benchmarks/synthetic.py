@@ -0,0 +1,85 @@
+"""Synthetic Uniqlo ranked-products payloads for the benchmarks.
+
+Items carry every field of `uniqlo_pydantic_model.FullUniqloProduct`, so they validate against both it and the
+trimmed `UniqloProduct` that the parser uses.
+"""
+import random
+from typing import List
+
+CATEGORIES = ["OUTERWEAR", "TOPS", "BOTTOMS", "INNERWEAR & UNDERWEAR", "LOUNGEWEAR & HOME", "ACCESSORIES"]
+COLORS = ["WHITE", "BLACK", "NAVY", "GRAY", "BEIGE", "RED", "OLIVE", "BLUE"]
+SIZES = ["XXS", "XS", "S", "M", "L", "XL", "XXL", "3XL"]
+
+
+def make_chip(code: str, name: str) -> dict:
+    return {"code": code, "displayCode": code[-2:], "name": name, "display": {"showFlag": True, "chipType": 0}}
+
+
+def make_color(index: int) -> dict:
+    color = make_chip(f"COL{index:02d}", COLORS[index % len(COLORS)])
+    color["filterCode"] = color["name"]
+    return color
+
+
+def make_price(value: float) -> dict:
+    return {"currency": {"code": "USD", "symbol": "$"}, "value": value}
+
+
+def make_uniqlo_item(index: int, rng: random.Random = None) -> dict:
+    """Builds one ranked-products item whose `productId` is derived from `index`."""
+    rng = rng or random.Random(index)
+    product_id = f"E{400000 + index:06d}-000"
+    base_price = rng.choice([9.9, 14.9, 19.9, 29.9, 39.9, 49.9, 69.9, 99.9])
+    on_sale = rng.random() < 0.3
+    colors = [make_color(i) for i in rng.sample(range(len(COLORS)), rng.randint(1, 5))]
+    sizes = [make_chip(f"SMA{i:03d}", SIZES[i]) for i in range(rng.randint(1, len(SIZES)))]
+    image_root = f"https://image.uniqlo.com/UQ/ST3/us/imagesgoods/{400000 + index}/item"
+    gender = rng.choice(["MEN", "WOMEN", "UNISEX"])
+
+    return {
+        "colors": colors,
+        "genderName": gender,
+        "genderCategory": gender,
+        "images": {
+            "main": {c["displayCode"]: {"image": f"{image_root}/goods_{c['displayCode']}.jpg", "model": []}
+                     for c in colors},
+            "chip": {c["displayCode"]: f"{image_root}/chip_{c['displayCode']}.jpg" for c in colors},
+            "sub": [{"image": f"{image_root}/sub_{i}.jpg", "model": []} for i in range(rng.randint(0, 6))],
+        },
+        "l1Id": str(400000 + index),
+        "name": f"Synthetic Product {index}",
+        "prices": {
+            "base": make_price(base_price),
+            "promo": make_price(round(base_price * 0.7, 1)) if on_sale else None,
+            "isDualPrice": on_sale,
+        },
+        "productId": product_id,
+        "priceGroup": "00",
+        "plds": [],
+        "rating": {"average": round(rng.uniform(1, 5), 1), "count": rng.randint(0, 2000)},
+        "representative": {
+            "color": colors[0],
+            "flags": {"priceFlags": [], "productFlags": []},
+            "l2Id": f"{400000 + index}001",
+            "pld": make_chip("PLD000", "ONE"),
+            "sales": on_sale,
+            "size": sizes[0],
+            "communicationCode": product_id,
+        },
+        "sizes": sizes,
+        "promotionText": "",
+        "storeStockOnly": False,
+    }
+
+
+def make_ranked_payload(n: int, page_size: int = 62, duplicate_ratio: float = 0.1, seed: int = 0) -> List[list]:
+    """Builds `[items, category]` pages holding `n` items in total, `duplicate_ratio` of which repeat earlier
+        products the way the same product shows up under several ranked categories."""
+    rng = random.Random(seed)
+    unique = max(1, int(n * (1 - duplicate_ratio)))
+    items = [make_uniqlo_item(i) for i in range(unique)]
+    items += [items[rng.randrange(unique)] for _ in range(n - unique)]
+    rng.shuffle(items)
+
+    return [[items[start:start + page_size], CATEGORIES[(start // page_size) % len(CATEGORIES)]]
+            for start in range(0, n, page_size)]
@@ -1,4 +1,9 @@
+from __future__ import annotations
+
 import json
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional
 
 import typer
 from rich import print
@@ -6,9 +11,11 @@ from rich.console import Console
 from rich.table import Table
 from rich.theme import Theme
 
-import src.local_settings.local_database as db
-from src.models.store import Store
-from utils.get_parser import get_store_obj
+if TYPE_CHECKING:
+    from src.models.store import Store
+
+# Database and parser modules are imported inside the commands that need them, so that local-only commands such
+# as `show stores` never import the parsers or touch the remote database.
 
 custom_theme = Theme({
     "info": "dim cyan",
@@ -31,11 +38,84 @@ app.add_typer(delete_app, name="delete")
 commit_app = typer.Typer()
 app.add_typer(commit_app, name="commit")
 
+
+MAX_MEMORY_HELP = "Memory budget such as 512MB or 512M. Products are processed and released in batches sized to fit it."
+
+
+@app.callback()
+def main(ctx: typer.Context,
+         profile: bool = typer.Option(False, help="Print the time, items, bytes and database round trips of each "
+                                                  "stage when the command finishes."),
+         profile_json: Optional[Path] = typer.Option(None, help="Write the same profile to a JSON file."),
+         profile_memory: bool = typer.Option(False, help="Also track the peak memory of each stage. Much slower.")):
+    if profile_memory:
+        profile = profile or profile_json is None
+    if profile or profile_json is not None:
+        from utils.metrics import metrics
+
+        metrics.enable(memory=profile_memory)
+        ctx.call_on_close(lambda: report_profile(metrics.report(), show_table=profile, json_file=profile_json))
+
+
+def report_profile(report: dict, show_table: bool = True, json_file: Optional[Path] = None) -> None:
+    if json_file is not None:
+        json_file.write_text(json.dumps(report, indent=2))
+        console.print(f"Profile written to {json_file}", style='info')
+    if not show_table:
+        return
+
+    title = f"Profile ({report['wall_seconds']:.2f} s wall"
+    if "peak_memory" in report:
+        title += f", {report['peak_memory'] / 1e6:.1f} MB peak"
+    table = Table(title=title + ")", show_header=True, header_style="bold blue",
+                  caption="Stages nest and are inclusive; http time is summed over worker threads.")
+    table.add_column("Stage")
+    columns = ["Calls", "Seconds", "Items", "Items/s", "MB", "DB round trips"]
+    if "peak_memory" in report:
+        columns.append("Peak MB")
+    for column in columns:
+        table.add_column(column, justify="right")
+    for stage in report["stages"]:
+        rate = stage["items"] / stage["seconds"] if stage["seconds"] and stage["items"] else None
+        row = [stage["stage"], str(stage["calls"]), f"{stage['seconds']:.3f}", f"{stage['items']:,}",
+               f"{rate:,.0f}" if rate else "", f"{stage['bytes'] / 1e6:.2f}" if stage["bytes"] else "",
+               f"{stage['round_trips']:,}"]
+        if "peak_memory" in report:
+            row.append(f"{stage['peak_memory'] / 1e6:.1f}" if stage["peak_memory"] is not None else "")
+        table.add_row(*row)
+    print(table)
+
+
+def parse_size(value: Optional[str]) -> Optional[int]:
+    """Converts a size such as `512MB`, `512M`, `2GB` or a plain number of bytes to bytes."""
+    if value is None:
+        return None
+    units = {"KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "B": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    number = value.strip().upper()
+    factor = 1
+    for unit, unit_factor in units.items():
+        if number.endswith(unit):
+            number, factor = number[:-len(unit)], unit_factor
+            break
+    try:
+        size = int(float(number) * factor)
+    except ValueError:
+        raise Exception(f"Invalid size `{value}`, expected a number of bytes or e.g. 512MB, 512M or 2GB.")
+    if size <= 0:
+        raise Exception(f"Invalid size `{value}`, it must be positive.")
+    return size
+
+
 @add_app.command("store", short_help='adds brand')
-def add_store(brand: str, alias: str, comments: str = None):
+def add_store(brand: str, alias: str, comments: str = None, max_workers: int = 8,
+              offline: bool = typer.Option(False, help="Replay cached responses without touching the network."),
+              resume: bool = typer.Option(False, help="Keep the pages fetched by an earlier attempt at `alias` that "
+                                                      "failed and only fetch the rest.")):
+    import src.local_settings.local_database as db
+    from utils.get_parser import get_store_obj
+
     store: Store = get_store_obj(brand)
-    data = json.dumps(store.get_data(), indent=2)
-    db.add_store(brand, alias, comments, data=data)
+    db.add_checkpointed_store(store, alias, comments, resume=resume, local_data=offline, max_workers=max_workers)
     try:
         pass
     except Exception as e:
@@ -43,22 +123,91 @@ def add_store(brand: str, alias: str, comments: str = None):
     show_stores()
 
 
+@add_app.command("stores", short_help='scrape and parse several brands in parallel')
+def add_stores(brands: List[str], alias: str = typer.Option("{brand}_{date}", help="Alias template for each "
+                                                           "store and its catalog. Fields: {brand}, {date}."),
+               comments: str = None, processes: Optional[int] = typer.Option(None, help="Worker processes, one "
+                                                                             "per brand by default."),
+               max_workers: int = 8,
+               offline: bool = typer.Option(False, help="Replay cached responses without touching the network."),
+               parse: bool = typer.Option(True, help="Also parse each store into a catalog."),
+               strict: bool = typer.Option(False, help="Fully validate every scraped item, to debug bad data.")):
+    import src.local_settings.local_database as db
+    from src.models.store import Product
+    from utils.codec import iter_unpack
+    from utils.scrape_pool import scrape_stores
+
+    date = datetime.now().strftime("%Y-%m-%d_%H-%M")
+    for result in scrape_stores(brands, processes=processes, offline=offline, max_workers=max_workers, parse=parse,
+                                validation='strict' if strict else 'fast'):
+        if result.error is not None:
+            console.print(f'Error: {result.brand}: {result.error}', style='danger')
+            continue
+        store_alias = alias.format(brand=result.brand, date=date)
+        try:
+            with db.transaction() as session:
+                db.add_store(result.brand, store_alias, comments, data=iter_unpack(result.raw), session=session)
+                if result.products is not None:
+                    db.add_parsed_catalog(store_alias, store_alias, comments,
+                                          (Product(**p) for p in iter_unpack(result.products)), session=session)
+        except Exception as e:
+            console.print(f'Error: {result.brand}: {e}', style='danger')
+            continue
+        console.print(f"{result.brand}: {result.items} items, {result.product_count} products in "
+                      f"{result.seconds:.1f} s, saved as `{store_alias}`", style='info')
+    show_stores()
+
+
 @add_app.command("catalog", short_help='add catalogue of products for a store')
-def add_catalog(store_alias: str, alias: str, comments: str = None):
+def add_catalog(store_alias: str, alias: str, comments: str = None,
+                strict: bool = typer.Option(False, help="Fully validate every scraped item, to debug bad data."),
+                max_memory: Optional[str] = typer.Option(None, help=MAX_MEMORY_HELP)):
+    import src.local_settings.local_database as db
+
     try:
-        db.add_catalog(store_alias, alias, comments=comments)
+        db.add_catalog(store_alias, alias, comments=comments, validation='strict' if strict else 'fast',
+                       max_memory=parse_size(max_memory))
     except Exception as e:
         console.print(f'Error: {e}', style='danger')
     show_catalogs()
 
 
+@app.command("init", short_help="create or upgrade the remote database tables")
+def init():
+    from src.models.productsql import migrate
+    from utils.db_utils import get_remote_engine
+
+    migrate(get_remote_engine())
+    console.print("Remote database is up to date.", style='info')
+
+
+@app.command("compact", short_help="rewrite old stores and catalogs in the current storage format")
+def compact():
+    import src.local_settings.local_database as db
+
+    rewritten, size_before, size_after = db.compact()
+    if rewritten:
+        console.print(f"Rewrote {rewritten} rows: {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB",
+                      style='info')
+    else:
+        console.print("All rows are already compact.", style='info')
+
+
 @app.command()
 def show():
     show_stores()
 
+def print_next_page(rows: list, limit: int) -> None:
+    if len(rows) == limit:
+        console.print(f"Showing {limit} rows. Pass --after {rows[-1][0]} for the next page.", style='info')
+
+
 @show_app.command("stores", short_help="show a table of all brands")
-def show_stores():
-    stores = db.get_all_stores()
+def show_stores(limit: int = 50, after: Optional[int] = None, brand: Optional[str] = None,
+                since: Optional[datetime] = None):
+    import src.local_settings.local_database as db
+
+    stores = db.get_all_stores(limit=limit, after=after, brand=brand, since=since)
 
     print("[bold magenta]Stores[/bold magenta]!", "🛒")
 
@@ -72,10 +221,14 @@ def show_stores():
     for store in stores:
         table.add_row(*store)
     print(table)
+    print_next_page(stores, limit)
 
 @show_app.command("catalog", short_help="show the list of selected products for a store")
-def show_catalogs():
-    catalogs = db.get_all_catalogs()
+def show_catalogs(limit: int = 50, after: Optional[int] = None, brand: Optional[str] = None,
+                  since: Optional[datetime] = None, uncommitted: bool = False):
+    import src.local_settings.local_database as db
+
+    catalogs = db.get_all_catalogs(limit=limit, after=after, brand=brand, since=since, uncommitted=uncommitted)
 
     print("[bold magenta]Catalogs[/bold magenta]!", "🛒")
 
@@ -91,9 +244,24 @@ def show_catalogs():
     for catalog in catalogs:
         table.add_row(*catalog)
     print(table)
+    print_next_page(catalogs, limit)
+
+@show_app.command("changes", short_help="show how many items changed between two store snapshots")
+def show_changes(old_alias: str, new_alias: str):
+    import src.local_settings.local_database as db
+
+    try:
+        added, removed, kept = db.diff_stores(old_alias, new_alias)
+    except Exception as e:
+        console.print(f'Error: {e}', style='danger')
+        return
+    print(f"[green]+{added}[/green] [red]-{removed}[/red] {kept} unchanged")
+
 
 @show_app.command("store", short_help="show the products for a given store")
 def delete_stores(alias: str):
+    import src.local_settings.local_database as db
+
     try:
         db.delete_store(alias)
     except Exception as e:
@@ -103,17 +271,37 @@ def delete_stores(alias: str):
 
 @delete_app.command("catalog", short_help="delete a catalog from the list")
 def delete_catalogs(alias: str):
+    import src.local_settings.local_database as db
+
     try:
         db.delete_catalog(alias)
     except Exception as e:
         console.print(f'Warning: {e}', style='warning')
     show_catalogs()
 
+
+@delete_app.command("parse-cache", short_help="forget cached parses so the next catalogs parse their store again")
+def delete_parse_cache(brand: Optional[str] = typer.Option(None, help="Only forget the parses of this brand.")):
+    import src.local_settings.local_database as db
+
+    deleted = db.clear_parse_cache(brand)
+    console.print(f"Deleted {deleted} cached parses.", style='info')
+
+
 @commit_app.command("catalog", short_help="commit a catalog from the list")
-def commit_catalog(alias: str):
-    db.commit_catalog(alias)
+def commit_catalog(alias: str, max_memory: Optional[str] = typer.Option(None, help=MAX_MEMORY_HELP),
+                   batch_size: Optional[int] = typer.Option(None, help="Products per upsert, 1000 by default."),
+                   writers: int = typer.Option(0, help="Write batches from this many threads while the catalog is "
+                                                       "still being read. Each batch commits on its own."),
+                   queue_depth: Optional[int] = typer.Option(None, help="Batches the reader may get ahead of the "
+                                                                        "writers, 4 by default."),
+                   copy: bool = typer.Option(False, help="Bulk load with PostgreSQL COPY into staging tables and "
+                                                         "merge them with set-based statements.")):
+    import src.local_settings.local_database as db
+
     try:
-        pass
+        db.commit_catalog(alias, max_memory=parse_size(max_memory), batch_size=batch_size, writers=writers,
+                          queue_depth=queue_depth, loader='copy' if copy else 'upsert')
     except Exception as e:
         console.print(f'Error: {e}', style='danger')
     show_catalogs()
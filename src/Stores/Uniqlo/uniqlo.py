@@ -1,60 +1,175 @@
 import json
 from operator import itemgetter
 from pathlib import Path
-from typing import List, Dict, Literal
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Literal, NamedTuple, Optional, Tuple
 
-import requests
-from pydantic import Json
+from pydantic import TypeAdapter
 
-from src.models.store import Product, Store
+from src.models.store import Product, Store, Validation
 from src.Stores.Uniqlo.uniqlo_pydantic_model import UniqloProduct, ImageMainItem
+from utils.get_parser import register_store
+from utils.http_cache import ResponseCache
+from utils.http_utils import DEFAULT_MAX_WORKERS, fetch_paged, get_json, get_session
+from utils.metrics import metrics
+
+if TYPE_CHECKING:
+    from src.local_settings.local_database import Checkpoint
 
 Extension = Literal['json', 'csv']
 
-def get_local_data() -> Json:
-    f = open(Path(__file__).parent / 'downloaded_data' / 'ranked_data.json' )
-    data = json.load(f)
-    return [(data['result']['items'], '')]
-
-
-def get_api_data():
-    url = "https://www.uniqlo.com/us/api/commerce/v5/en/recommendations/ranked-products"
-    payload = ""
-    headers = {
-        "sec-ch-ua": "\"Google Chrome\";v=\"125\", \"Chromium\";v=\"125\", \"Not.A/Brand\";v=\"24\"",
-        "Referer": "https://www.uniqlo.com/us/en/spl/ranking/men",
-        "DNT": "1",
-        "x-fr-clientid": "uq.us.web-spa",
-        "sec-ch-ua-mobile": "?0",
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) "
-                      "Chrome/125.0.0.0 Safari/537.36",
-        "sec-ch-ua-platform": "\"macOS\""
+API_URL = "https://www.uniqlo.com/us/api/commerce/v5/en/recommendations/ranked-products"
+
+GENDERS = ["men", "women"]
+
+PAGE_SIZE = 62
+"""Number of products requested per page."""
+
+MAX_PAGES = 500
+"""Pages fetched per category at most, in case the API stops honoring `offset` without reporting a total."""
+
+HEADERS = {
+    "sec-ch-ua": "\"Google Chrome\";v=\"125\", \"Chromium\";v=\"125\", \"Not.A/Brand\";v=\"24\"",
+    "Referer": "https://www.uniqlo.com/us/en/spl/ranking/men",
+    "DNT": "1",
+    "x-fr-clientid": "uq.us.web-spa",
+    "sec-ch-ua-mobile": "?0",
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) "
+                  "Chrome/125.0.0.0 Safari/537.36",
+    "sec-ch-ua-platform": "\"macOS\""
+}
+
+
+def get_categories() -> Dict[str, Dict[str, str]]:
+    """Loads the gender -> {category id: category name} mapping used to query the API."""
+    categories_file_path = Path(__file__).parent / 'downloaded_data' / 'categories.json'
+    with open(categories_file_path) as category_file:
+        return json.load(category_file)
+
+
+class CategoryPage(NamedTuple):
+    """One page of the ranked products of a gender and category."""
+    gender: str
+    category_id: str
+    category: str
+    offset: int = 0
+    product_ids: Tuple[str, ...] = ()
+    """Product ids of the previous page, to notice the API returning the same page over and over."""
+
+
+def get_querystring(page: CategoryPage, page_size: int = PAGE_SIZE) -> Dict[str, str]:
+    return {
+        "schema": "general",
+        "genders": page.gender,
+        "isDiscount": "false",
+        "isAreaAvailable": "false",
+        "limit": str(page_size),
+        "offset": str(page.offset),
+        "categoryIds": page.category_id,
+        "temperatureSensitive": "false",
+        "httpFailure": "true"
     }
 
-    script_dir = Path(__file__).parent
-    categories_file_path = script_dir / 'downloaded_data' / 'categories.json'
-    category_file = open(categories_file_path)
-    cats = json.load(category_file)
 
-    data = []
+def next_page(page: CategoryPage, result: dict, page_size: int = PAGE_SIZE) -> CategoryPage | None:
+    """Returns the page after `page`, or None once the category has been fully fetched, the page repeats the
+        previous one or `MAX_PAGES` were fetched."""
+    items = result['items']
+    offset = page.offset + len(items)
+    total = result.get('pagination', {}).get('total')
+    if len(items) < page_size or (total is not None and offset >= total):
+        return None
+    if repeats_previous(page, result):
+        print(f"Stopping {page.gender} {page.category} at offset {page.offset}: the page repeats the previous one")
+        return None
+    if offset >= MAX_PAGES * page_size:
+        print(f"Stopping {page.gender} {page.category} after {MAX_PAGES} pages")
+        return None
+    return page._replace(offset=offset, product_ids=tuple(item.get('productId') for item in items))
+
+
+def repeats_previous(page: CategoryPage, result: dict) -> bool:
+    """Whether the API ignored `offset` and sent the same products as the page before `page`."""
+    return bool(page.product_ids) and tuple(item.get('productId') for item in result['items']) == page.product_ids
+
+
+def get_result(payload: Any) -> dict:
+    """Unwraps the `result` of an API response, raising on responses without a list of items, e.g. an error page
+        served with status 200, so that `ResponseCache` doesn't keep them."""
+    result = payload.get('result') if isinstance(payload, dict) else None
+    if not isinstance(result, dict) or not isinstance(result.get('items'), list):
+        raise Exception(f"Unexpected API response without result items: {str(payload)[:200]}")
+    return result
+
+
+def page_key(page: CategoryPage) -> Tuple[str, str, int]:
+    """Identifies a page in a scrape `Checkpoint`."""
+    return page.gender, page.category_id, page.offset
 
-    for gender_query in ["men", "women"]:
-        for category_id_query, category in cats[gender_query].items():
-            querystring = {
-                "schema": "general",
-                "genders": gender_query,
-                "isDiscount": "false",
-                "isAreaAvailable": "false",
-                "limit": "62",
-                "categoryIds": category_id_query,
-                "temperatureSensitive": "false",
-                "httpFailure": "true"
-            }
 
-            response = requests.request("GET", url, data=payload, headers=headers, params=querystring)
-            data.append([response.json()['result']['items'], category])  #response.json()
+def remaining_pages(first_pages: List[CategoryPage],
+                    done: Dict[tuple, Optional[tuple]]) -> List[CategoryPage]:
+    """Follows each category's chain of already fetched pages and returns the first page it still needs, leaving
+        out categories that were fetched completely."""
+    pages = []
+    for page in first_pages:
+        key = page_key(page)
+        while done.get(key) is not None:
+            key = done[key]
+        if key not in done:
+            pages.append(page._replace(offset=key[2]))
+    return pages
 
-    return data
+
+def print_progress(gender: str, category: str, count: int) -> None:
+    print(f"Fetched {count} {gender} {category} products")
+
+
+def iter_api_data(url: str = API_URL, max_workers: int = DEFAULT_MAX_WORKERS, cache: ResponseCache = None,
+                  page_size: int = PAGE_SIZE, on_category: Callable[[str, str, int], None] = None,
+                  checkpoint: "Checkpoint" = None) -> Iterator[Tuple[List[dict], str]]:
+    """Lazily yields `(items, category)` for every page of every gender and category, `max_workers` requests at a
+        time over one shared keep-alive session. Pages come category by category, so that the category a product
+        is first seen in, and thus parsed with, doesn't depend on `max_workers`. Responses go through `cache` when one is given, and
+        `on_category(gender, category, count)` is called as each category finishes. With a `checkpoint`, pages it
+        already holds are skipped and every fetched page is saved to it before being yielded."""
+    cats = get_categories()
+    first_pages = [CategoryPage(gender, category_id, category)
+                   for gender in GENDERS for category_id, category in cats[gender].items()]
+    if checkpoint is not None:
+        first_pages = remaining_pages(first_pages, checkpoint.done())
+    counts: Dict[Tuple[str, str], int] = {}
+
+    with get_session(max_workers, headers=HEADERS) as session:
+        def fetch(page: CategoryPage) -> dict:
+            return get_json(session, url, params=get_querystring(page, page_size), cache=cache, decode=get_result)
+
+        def follow(page: CategoryPage, result: dict) -> CategoryPage | None:
+            return next_page(page, result, page_size)
+
+        pages = fetch_paged(fetch, first_pages, follow, max_workers=max_workers)
+        for page, result, following in metrics.iter_stage('get_api_data', pages,
+                                                          count=lambda pr: len(pr[1]['items'])):
+            # A repeated page is dropped, but still checkpointed so that a resumed scrape knows the category is done.
+            items = [] if repeats_previous(page, result) else result['items']
+            key = (page.gender, page.category_id)
+            counts[key] = counts.get(key, 0) + len(items)
+            if checkpoint is not None:
+                checkpoint.save(page_key(page), None if following is None else page_key(following), items,
+                                page.category)
+            if on_category is not None and following is None:
+                on_category(page.gender, page.category, counts[key])
+            if items:
+                yield items, page.category
+
+    if cache is not None and not cache.offline:
+        cache.evict()
+
+
+def get_api_data(url: str = API_URL, max_workers: int = DEFAULT_MAX_WORKERS, cache: ResponseCache = None,
+                 page_size: int = PAGE_SIZE, on_category: Callable[[str, str, int], None] = None):
+    """Fetches every page of every gender and category as a list of `[items, category]` pairs."""
+    return [[items, category] for items, category in
+            iter_api_data(url, max_workers=max_workers, cache=cache, page_size=page_size, on_category=on_category)]
 
 
 def parse_images(imgs: Dict[str, ImageMainItem]) -> List[str]:
@@ -96,32 +211,65 @@ def parse_product(product: UniqloProduct, category='') -> Product:
     return product
 
 
+def parse_item(item: dict, category='') -> Product:
+    """Trusted fast path of `parse_product` that reads only the fields it needs straight from a raw item and skips
+        pydantic validation of both the item and the resulting `Product`."""
+    image_urls = sorted((image['image'] for image in item['images']['main'].values()), key=itemgetter(0))
+    prices = item['prices']
+    promo = prices.get('promo')
+    store_product_id = item['productId']
+
+    return Product.model_construct(
+        product_name=item['name'], brand='Uniqlo', category=category, gender=parse_gender(item['genderName']),
+        price=float(promo['value'] if promo is not None else prices['base']['value']), on_sale=promo is not None,
+        sizes_raw=[s['name'] for s in item['sizes']], images_raw=image_urls, store_product_id=store_product_id,
+        main_image_url=image_urls[0], product_url="https://www.uniqlo.com/us/en/products/" + store_product_id,
+        colors_raw=[c['name'] for c in item['colors']])
+
+
+UniqloProducts = TypeAdapter(List[UniqloProduct])
+"""Validates a whole page of raw items in one pass."""
+
+
+@register_store('Uniqlo')
 class Uniqlo(Store):
-    def __init__(self):
+    def __init__(self, validation: Validation = 'fast'):
         super().__init__(brand='Uniqlo')
+        self.validation = validation
 
-    def get_data(self, local_data=False):
-        if local_data:
-            self.raw_data = get_local_data()
-        else:
-            self.raw_data = get_api_data()
+    def iter_data(self, local_data=False, max_workers: int = DEFAULT_MAX_WORKERS, cache: ResponseCache = None,
+                  checkpoint: "Checkpoint" = None):
+        if cache is None:
+            cache = ResponseCache(offline=local_data)
+        return iter_api_data(max_workers=max_workers, cache=cache, on_category=print_progress, checkpoint=checkpoint)
+
+    def get_data(self, local_data=False, max_workers: int = DEFAULT_MAX_WORKERS, cache: ResponseCache = None):
+        self.raw_data = [[items, category] for items, category in
+                         self.iter_data(local_data=local_data, max_workers=max_workers, cache=cache)]
         return self.raw_data
 
-    def parse_file(self) -> None:
+    def iter_products(self) -> Iterator[Product]:
         data = self.raw_data
         if data is None:
             raise FileNotFoundError("Raw data not set")
 
-        unique_ids = []
+        seen_ids = set()
 
         for d, cat in data:
+            new_items = []
             for item in d:
-                uniqloProduct = UniqloProduct(**item)
-                product = parse_product(uniqloProduct, category=cat)
-                if product.store_product_id in unique_ids:
+                product_id = item.get('productId')
+                if product_id in seen_ids:
                     continue
-                unique_ids.append(product.store_product_id)
-                self.products.append(product)
+                seen_ids.add(product_id)
+                new_items.append(item)
+
+            if self.validation == 'strict':
+                for uniqloProduct in UniqloProducts.validate_python(new_items):
+                    yield parse_product(uniqloProduct, category=cat)
+            else:
+                for item in new_items:
+                    yield parse_item(item, category=cat)
 
 
 def main():
@@ -1,17 +1,46 @@
 from __future__ import annotations
-from typing import List, Optional
+import hashlib
+import json
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Tuple
 from datetime import datetime
-from sqlalchemy import ForeignKey
+from sqlalchemy import Engine, ForeignKey, Index, UniqueConstraint, delete, func, select, update
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.orm import (
     mapped_column,
     relationship,
     Mapped,
 )
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.orm import DeclarativeBase, Session
 
-from src.models.store import Store
-from utils.db_utils import SessionLocal, get_local_engine
-from utils.get_parser import get_store_obj
+from utils.codec import MANIFEST_VERSION, Packer, format_version, iter_unpack, pack, unpack
+from utils.db_utils import LazySessionmaker, get_local_engine
+from utils.metrics import metrics
+
+if TYPE_CHECKING:
+    from src.models.store import Loader, Product, Store, Validation
+
+
+BLOB_QUERY_SIZE = 500
+"""Maximum number of item hashes looked up per query, well under SQLite's bound parameter limit."""
+
+
+@lru_cache(maxsize=None)
+def get_engine() -> Engine:
+    """Gets the local engine, creating `local_settings.sqlite3` and any missing tables and indexes the first time
+        it is used rather than on import."""
+    engine = get_local_engine()
+    Base.metadata.create_all(bind=engine)
+    for table in Base.metadata.sorted_tables:  # create_all only adds indexes to the tables it creates.
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    return engine
+
+
+SessionLocal = LazySessionmaker(get_engine)
+"""Sessions on the local database, whose schema is created by `get_engine` on first use."""
 
 
 class Base(DeclarativeBase):
@@ -25,10 +54,11 @@ class Brand(Base):
     """Name of table in SQLite Database"""
     id: Mapped[int] = mapped_column(primary_key=True)
     """Primary Key"""
-    brand: Mapped[str] = mapped_column(nullable=False)
-    time_created: Mapped[datetime] = mapped_column(default=datetime.now(), nullable=False)
-    data: Mapped[Optional[str]]
-    """JSON string containing Pydantic validated raw data fetched from website."""
+    brand: Mapped[str] = mapped_column(nullable=False, index=True)
+    time_created: Mapped[datetime] = mapped_column(default=datetime.now, nullable=False)
+    data: Mapped[Optional[bytes]]
+    """Manifest of the `(items, category)` pages fetched from website, see `save_snapshot`. Older rows hold the
+    packed data itself or plain JSON text."""
     alias: Mapped[Optional[str]] = mapped_column(unique=True)
     """Unique name for this brand."""
     comments: Mapped[Optional[str]]
@@ -36,7 +66,7 @@ class Brand(Base):
     catalogues: Mapped[List["Catalog"]] = relationship(back_populates="store", cascade="all, delete-orphan")
     """One-to-many relationship between store and catalogues."""
 
-    def __init__(self, brand: str, alias: str = None, comments: str = None, data: str = None):
+    def __init__(self, brand: str, alias: str = None, comments: str = None, data: bytes = None):
         super().__init__()
         self.brand = brand
         self.alias = alias
@@ -54,13 +84,23 @@ class Brand(Base):
         yield self.comments
 
 
+class ItemBlob(Base):
+    """One raw scraped item, stored once no matter how many store snapshots contain it."""
+    __tablename__ = "item_blob"
+    hash: Mapped[str] = mapped_column(primary_key=True)
+    """Content hash of the item, see `item_hash`."""
+    data: Mapped[bytes] = mapped_column(nullable=False)
+    """Item packed by `utils.codec.pack`."""
+
+
 class Catalog(Base):
     __tablename__ = "catalog"
     id: Mapped[int] = mapped_column(primary_key=True)
     """Primary Key"""
-    data: Mapped[Optional[str]]
-    """JSON string containing Pydantic validated parsed data from `Brand.raw_data`."""
-    time_parsed: Mapped[datetime] = mapped_column(default=datetime.now(), nullable=False)
+    data: Mapped[Optional[bytes]]
+    """Only set on catalogs created before `CatalogProduct` existed: the Pydantic validated parsed data, packed by
+    `utils.codec.pack` or as plain JSON text."""
+    time_parsed: Mapped[datetime] = mapped_column(default=datetime.now, nullable=False)
     commited: Mapped[bool] = mapped_column(default=False, nullable=False)
     """Data committed to the Remote database or not."""
     error: Mapped[bool] = mapped_column(default=False, nullable=False)
@@ -68,13 +108,14 @@ class Catalog(Base):
     alias: Mapped[Optional[str]] = mapped_column(unique=True)
     """Unique name for parse."""
     comments: Mapped[Optional[str]]
-    store_id: Mapped[int] = mapped_column(ForeignKey("store.id"))
+    store_id: Mapped[int] = mapped_column(ForeignKey("store.id"), index=True)
     """Foreign key to store."""
 
     store: Mapped["Brand"] = relationship(back_populates="catalogues")
     """One-to-many relationship between store and catalogues."""
 
-    def __init__(self, store_id: int, alias: str, comments: str, data: str = None, commited: bool = False, error=False):
+    def __init__(self, store_id: int, alias: str, comments: str, data: bytes = None, commited: bool = False,
+                 error=False):
         super().__init__()
         self.alias = alias
         self.comments = comments
@@ -99,58 +140,476 @@ class Catalog(Base):
         yield '✅' if self.error == 1 else '❌'
 
 
-def add_store(brand: str, alias: str = None, comments: str = None, data: str = None):
-    """Adds store to the local database."""
-    with SessionLocal() as session:
-        store = Brand(brand, alias, comments, data=data)
+class CatalogProduct(Base):
+    """One parsed `Product` of a catalog."""
+    __tablename__ = "catalog_product"
+    __table_args__ = (
+        Index("ix_catalog_product_store_product_id", "catalog_id", "store_product_id"),
+        Index("ix_catalog_product_category", "catalog_id", "category"),
+        Index("ix_catalog_product_gender", "catalog_id", "gender"),
+        Index("ix_catalog_product_price", "catalog_id", "price"),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    """Primary Key"""
+    catalog_id: Mapped[int] = mapped_column(ForeignKey("catalog.id", ondelete="CASCADE"), nullable=False)
+    """Foreign key to catalog."""
+    store_product_id: Mapped[str]
+    product_name: Mapped[str]
+    brand: Mapped[str]
+    category: Mapped[str]
+    gender: Mapped[str]
+    price: Mapped[float]
+    on_sale: Mapped[bool]
+    main_image_url: Mapped[str]
+    product_url: Mapped[str]
+    sizes: Mapped[str]
+    """JSON list of `Product.sizes_raw`."""
+    colors: Mapped[Optional[str]]
+    """JSON list of `Product.colors_raw`."""
+    images: Mapped[Optional[str]]
+    """JSON list of `Product.images_raw`."""
+    tags: Mapped[Optional[str]]
+    """JSON list of `Product.tags`."""
+    extra: Mapped[Optional[str]]
+    """JSON text of `Product.extra`."""
+
+
+class ScrapeCheckpoint(Base):
+    """One page of an `add store` scrape that is still in progress, saved as soon as it was fetched."""
+    __tablename__ = "scrape_checkpoint"
+    __table_args__ = (UniqueConstraint("alias", "page_key"),)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    alias: Mapped[str] = mapped_column(nullable=False, index=True)
+    """Alias the finished store will be saved under."""
+    brand: Mapped[str] = mapped_column(nullable=False)
+    page_key: Mapped[str] = mapped_column(nullable=False)
+    """JSON key the parser uses to identify the page, e.g. `["men", "123", 62]`."""
+    next_key: Mapped[Optional[str]]
+    """JSON key of the page that follows, or null when this was the last page of its category."""
+    category: Mapped[Optional[str]]
+    hashes: Mapped[bytes] = mapped_column(nullable=False)
+    """Packed list of the page's item hashes; the items themselves are stored as `ItemBlob`s."""
+    time_created: Mapped[datetime] = mapped_column(default=datetime.now, nullable=False)
+
+
+class ParseCache(Base):
+    """Products a parser produced from a store snapshot, so that further catalogs of the same snapshot skip
+        parsing. Rows of other parser versions are never read and are purged whenever a new row is written."""
+    __tablename__ = "parse_cache"
+    __table_args__ = (UniqueConstraint("snapshot_hash", "parser", "parser_version"),)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    snapshot_hash: Mapped[str] = mapped_column(nullable=False)
+    """Hash of the store's `data`, see `snapshot_hash`."""
+    brand: Mapped[str] = mapped_column(nullable=False, index=True)
+    parser: Mapped[str] = mapped_column(nullable=False)
+    """Class name of the `Store` that parsed the snapshot."""
+    parser_version: Mapped[int] = mapped_column(nullable=False)
+    """`Store.parser_version` of that class at the time."""
+    products: Mapped[bytes] = mapped_column(nullable=False)
+    """Products dumped by `Store.dump_products`, packed by `utils.codec.Packer`."""
+    time_created: Mapped[datetime] = mapped_column(default=datetime.now, nullable=False)
+
+
+CATALOG_BATCH_SIZE = 1000
+"""Number of catalog products written per `INSERT`."""
+
+CATALOG_LIST_COLUMNS = {"sizes": "sizes_raw", "colors": "colors_raw", "images": "images_raw", "tags": "tags"}
+"""`CatalogProduct` JSON columns and the `Product` list fields they hold."""
+
+
+def catalog_product_row(catalog_id: int, product: Product) -> dict:
+    """Converts a `Product` into the column values of its `catalog_product` row."""
+    row = product.model_dump(exclude=set(CATALOG_LIST_COLUMNS.values()) | {"extra"})
+    row["catalog_id"] = catalog_id
+    for column, field in CATALOG_LIST_COLUMNS.items():
+        row[column] = json.dumps(getattr(product, field) or [])
+    row["extra"] = None if product.extra is None else json.dumps(product.extra)
+    return row
+
+
+def add_catalog_products(session: Session, catalog_id: int, products: Iterable[Product],
+                         batch_size: int = CATALOG_BATCH_SIZE) -> int:
+    """Writes a stream of products to `catalog_product` with one `INSERT` per batch and returns how many."""
+    from src.models.product_sync import batched
+
+    count = 0
+    for batch in batched(products, batch_size):
+        session.execute(insert(CatalogProduct), [catalog_product_row(catalog_id, p) for p in batch])
+        count += len(batch)
+    return count
+
+
+def iter_catalog_products(session: Session, catalog_id: int, category: str = None, gender: str = None,
+                          min_price: float = None, max_price: float = None,
+                          batch_size: int = CATALOG_BATCH_SIZE) -> Iterator[Product]:
+    """Streams the products of a catalog, optionally filtered, fetching `batch_size` rows at a time."""
+    from src.models.store import Product
+
+    conditions = [CatalogProduct.catalog_id == catalog_id]
+    if category is not None:
+        conditions.append(CatalogProduct.category == category)
+    if gender is not None:
+        conditions.append(CatalogProduct.gender == gender)
+    if min_price is not None:
+        conditions.append(CatalogProduct.price >= min_price)
+    if max_price is not None:
+        conditions.append(CatalogProduct.price <= max_price)
+
+    columns = [c for c in CatalogProduct.__table__.columns if c.key not in ("id", "catalog_id")]
+    stmt = select(*columns).where(*conditions)
+    for row in session.execute(stmt.order_by(CatalogProduct.id).execution_options(yield_per=batch_size)):
+        values = row._asdict()
+        for column, field in CATALOG_LIST_COLUMNS.items():
+            values[field] = json.loads(values.pop(column) or "[]")
+        if values["extra"] is None:
+            del values["extra"]
+        yield Product(**values)
+
+
+def item_hash(item: Any) -> str:
+    """Content hash of a raw item, independent of key order."""
+    data = json.dumps(item, sort_keys=True, separators=(',', ':')).encode()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def save_items(session: Session, items: List[Any]) -> List[str]:
+    """Stores the items of one page as content-addressed `ItemBlob`s, skipping items that are already stored, and
+        returns their hashes in order."""
+    blobs = {item_hash(item): item for item in items}
+    hashes = list(blobs) if len(blobs) == len(items) else [item_hash(item) for item in items]
+    if blobs:
+        session.execute(insert(ItemBlob).on_conflict_do_nothing(),
+                        [{"hash": h, "data": pack(item)} for h, item in blobs.items()])
+    return hashes
+
+
+def save_snapshot(session: Session, pages: Iterable[Tuple[List[Any], str]]) -> bytes:
+    """Stores every item of the `(items, category)` pages with `save_items` and returns the snapshot's packed
+        manifest of `[category, [hash, ...]]` pages."""
+    manifest = [[category, save_items(session, items)] for items, category in pages]
+    return pack(manifest, version=MANIFEST_VERSION)
+
+
+def get_snapshot_hashes(data: bytes | str | None) -> set[str]:
+    """Returns the item hashes referenced by a store's manifest, empty for rows that aren't manifests."""
+    if format_version(data) != MANIFEST_VERSION:
+        return set()
+    return {h for _, hashes in unpack(data) for h in hashes}
+
+
+def iter_snapshot(session: Session, data: bytes | str | None) -> Iterator[Tuple[List[Any], str]]:
+    """Lazily reassembles the `(items, category)` pages of a store snapshot, loading one page of items at a time.
+        Rows written before manifests existed are decoded incrementally, one page at a time."""
+    if format_version(data) != MANIFEST_VERSION:
+        yield from iter_unpack(data)
+        return
+    for category, hashes in unpack(data):
+        blobs = {}
+        unique = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique), BLOB_QUERY_SIZE):
+            chunk = unique[start:start + BLOB_QUERY_SIZE]
+            blobs.update(session.execute(select(ItemBlob.hash, ItemBlob.data).where(ItemBlob.hash.in_(chunk))).all())
+        yield [unpack(blobs[h]) for h in hashes], category
+
+
+def gc_blobs(session: Session) -> int:
+    """Deletes the item blobs that no store snapshot or unfinished scrape references anymore and returns how many."""
+    referenced = set()
+    for data in session.scalars(select(Brand.data)):
+        referenced |= get_snapshot_hashes(data)
+    for hashes in session.scalars(select(ScrapeCheckpoint.hashes)):
+        referenced.update(unpack(hashes))
+    orphans = [h for h in session.scalars(select(ItemBlob.hash)) if h not in referenced]
+    for start in range(0, len(orphans), BLOB_QUERY_SIZE):
+        session.execute(delete(ItemBlob).where(ItemBlob.hash.in_(orphans[start:start + BLOB_QUERY_SIZE])))
+    return len(orphans)
+
+
+def snapshot_hash(data: bytes | str) -> str:
+    """Hash identifying the raw data of a store. Manifests list the hash of every item, so equal snapshots hash
+        alike."""
+    if isinstance(data, str):
+        data = data.encode()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def get_cached_parse(session: Session, store: Store, data_hash: str) -> Optional[bytes]:
+    """Returns the packed products `store`'s current parser made from the snapshot with `data_hash`, if any."""
+    return session.scalar(select(ParseCache.products).where(
+        ParseCache.snapshot_hash == data_hash, ParseCache.parser == type(store).__name__,
+        ParseCache.parser_version == store.parser_version))
+
+
+def iter_packing(products: Iterable[Product], packer: Packer) -> Iterator[Product]:
+    """Passes `products` through, adding each one to `packer` as it goes by."""
+    for product in products:
+        packer.add(product.model_dump(exclude_unset=True))
+        yield product
+
+
+def cache_parse(session: Session, store: Store, data_hash: str, products: bytes) -> None:
+    """Saves the packed products `store` parsed from the snapshot with `data_hash`, and purges what other versions
+        of the parser cached."""
+    parser = type(store).__name__
+    session.execute(delete(ParseCache).where(ParseCache.parser == parser,
+                                             ParseCache.parser_version != store.parser_version))
+    row = {"snapshot_hash": data_hash, "brand": store.brand, "parser": parser,
+           "parser_version": store.parser_version, "products": products, "time_created": datetime.now()}
+    stmt = insert(ParseCache).values(row)
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=[ParseCache.snapshot_hash, ParseCache.parser, ParseCache.parser_version],
+        set_={c: stmt.excluded[c] for c in ("brand", "products", "time_created")}))
+
+
+def gc_parse_cache(session: Session) -> int:
+    """Deletes the cached parses of snapshots that no store holds anymore and returns how many."""
+    kept = {snapshot_hash(data) for data in session.scalars(select(Brand.data).where(Brand.data.is_not(None)))}
+    orphans = [id_ for id_, h in session.execute(select(ParseCache.id, ParseCache.snapshot_hash)) if h not in kept]
+    for start in range(0, len(orphans), BLOB_QUERY_SIZE):
+        session.execute(delete(ParseCache).where(ParseCache.id.in_(orphans[start:start + BLOB_QUERY_SIZE])))
+    return len(orphans)
+
+
+def clear_parse_cache(brand: str = None) -> int:
+    """Deletes every cached parse, or only those of `brand`, and returns how many."""
+    with transaction() as session:
+        stmt = delete(ParseCache)
+        if brand is not None:
+            stmt = stmt.where(ParseCache.brand == brand)
+        return session.execute(stmt).rowcount
+
+
+def transaction():
+    """Context manager yielding a local session whose writes commit together on exit. Pass the session to several
+        `add_*` calls to group them into a single transaction."""
+    return SessionLocal.begin()
+
+
+@contextmanager
+def write_session(session: Session = None) -> Iterator[Session]:
+    """Yields `session` when the caller is grouping writes in its own transaction, otherwise a new session that
+        commits on exit."""
+    if session is not None:
+        yield session
+        return
+    with transaction() as session:
+        yield session
+
+
+def add_store(brand: str, alias: str = None, comments: str = None, data: Iterable[Tuple[List[Any], str]] = None,
+              session: Session = None):
+    """Adds store to the local database. `data` is consumed page by page as it is stored, so it can be the
+        generator returned by `Store.iter_data`. Writes join `session`'s transaction when one is given."""
+    with metrics.stage('add_store'), write_session(session) as session:
+        store = Brand(brand, alias, comments, data=save_snapshot(session, data or []))
         session.add(store)
-        session.commit()
 
 
-def get_all_stores() -> list[list[str | None]]:
-    """Returns all stores in the local database."""
+PageKey = Tuple[Any, ...]
+
+
+class Checkpoint(object):
+    """Saves every page of a scrape to `scrape_checkpoint` as soon as it is fetched, each in its own transaction,
+        so that a failed `add store` can be resumed by fetching only the pages that are missing. Parsers get it
+        through `Store.iter_data(checkpoint=...)` and identify pages by JSON-serializable keys."""
+    def __init__(self, brand: str, alias: str):
+        self.brand = brand
+        self.alias = alias
+
+    def done(self) -> Dict[PageKey, Optional[PageKey]]:
+        """Maps the key of every saved page to the key of the page after it, or None for a category's last page."""
+        with SessionLocal() as session:
+            rows = session.execute(select(ScrapeCheckpoint.page_key, ScrapeCheckpoint.next_key)
+                                   .where(ScrapeCheckpoint.alias == self.alias))
+            return {tuple(json.loads(key)): None if next_key is None else tuple(json.loads(next_key))
+                    for key, next_key in rows}
+
+    def save(self, key: PageKey, next_key: Optional[PageKey], items: List[Any], category: str) -> None:
+        """Stores a fetched page and commits it right away."""
+        with transaction() as session:
+            row = {"alias": self.alias, "brand": self.brand, "page_key": json.dumps(list(key)),
+                   "next_key": None if next_key is None else json.dumps(list(next_key)), "category": category,
+                   "hashes": pack(save_items(session, items)), "time_created": datetime.now()}
+            stmt = insert(ScrapeCheckpoint).values(row)
+            session.execute(stmt.on_conflict_do_update(
+                index_elements=[ScrapeCheckpoint.alias, ScrapeCheckpoint.page_key],
+                set_={c: stmt.excluded[c] for c in ("next_key", "category", "hashes", "time_created")}))
+
+    def count(self) -> int:
+        with SessionLocal() as session:
+            return session.scalar(select(func.count()).where(ScrapeCheckpoint.alias == self.alias))
+
+    def manifest(self, session: Session) -> bytes:
+        """Assembles the snapshot manifest from the saved pages, in the order they were first fetched."""
+        rows = session.execute(select(ScrapeCheckpoint.category, ScrapeCheckpoint.hashes)
+                               .where(ScrapeCheckpoint.alias == self.alias).order_by(ScrapeCheckpoint.id))
+        return pack([[category, unpack(hashes)] for category, hashes in rows], version=MANIFEST_VERSION)
+
+    def clear(self, session: Session = None) -> None:
+        with write_session(session) as session:
+            session.execute(delete(ScrapeCheckpoint).where(ScrapeCheckpoint.alias == self.alias))
+
+
+def add_checkpointed_store(store: Store, alias: str, comments: str = None, resume: bool = False, **iter_options):
+    """Scrapes `store` page by page into a `Checkpoint` and then adds the assembled snapshot as store `alias`,
+        clearing the checkpoint in the same transaction. With `resume`, pages saved by an earlier attempt that
+        failed are kept and only the missing ones are fetched; otherwise any leftover pages are discarded first."""
     with SessionLocal() as session:
-        stores = [list(s) for s in session.query(Brand).all()]
-        return stores
+        if session.scalar(select(Brand.id).where(Brand.alias == alias)) is not None:
+            raise Exception(f"A store with the alias `{alias}` already exists.")
+
+    checkpoint = Checkpoint(store.brand, alias)
+    if resume:
+        print(f"Resuming `{alias}` with {checkpoint.count()} pages already fetched")
+    else:
+        checkpoint.clear()
+    for _ in store.iter_data(checkpoint=checkpoint, **iter_options):
+        pass
+
+    with metrics.stage('add_store'), transaction() as session:
+        session.add(Brand(store.brand, alias, comments, data=checkpoint.manifest(session)))
+        checkpoint.clear(session)
 
 
-def get_all_catalogs() -> list[list[str | None]]:
-    """Returns all catalogs in the local database."""
+def diff_stores(old_alias: str, new_alias: str) -> tuple[int, int, int]:
+    """Compares the manifests of two store snapshots. Returns how many items were added, removed and kept."""
     with SessionLocal() as session:
-        catalogs = [list(c) for c in session.query(Catalog).all()]
-        return catalogs
+        snapshots = []
+        for alias in (old_alias, new_alias):
+            data = session.scalar(select(Brand.data).where(Brand.alias == alias))
+            if data is None:
+                raise Exception(f"There is no store associated with the alias `{alias}`.")
+            if format_version(data) != MANIFEST_VERSION:
+                raise Exception(f"Store `{alias}` predates snapshot manifests. Run `compact` first.")
+            snapshots.append(get_snapshot_hashes(data))
+        old, new = snapshots
+        return len(new - old), len(old - new), len(old & new)
+
+
+PAGE_SIZE = 50
+"""Default number of rows returned by the `get_all_*` listings."""
+
+
+def get_all_stores(limit: int = PAGE_SIZE, after: int = None, brand: str = None,
+                   since: datetime = None) -> list[list[str | None]]:
+    """Returns up to `limit` stores with an id greater than `after`, optionally filtered by brand and creation
+        time. Only the listed columns are read, never the snapshot data."""
+    stmt = select(Brand.id, Brand.brand, Brand.time_created, Brand.alias, Brand.comments)
+    if after is not None:
+        stmt = stmt.where(Brand.id > after)
+    if brand is not None:
+        stmt = stmt.where(Brand.brand == brand)
+    if since is not None:
+        stmt = stmt.where(Brand.time_created >= since)
 
+    with SessionLocal() as session:
+        rows = session.execute(stmt.order_by(Brand.id).limit(limit))
+        return [[str(id_), brand, str(time_created), alias, comments]
+                for id_, brand, time_created, alias, comments in rows]
+
+
+def get_all_catalogs(limit: int = PAGE_SIZE, after: int = None, brand: str = None, since: datetime = None,
+                     uncommitted: bool = False) -> list[list[str | None]]:
+    """Returns up to `limit` catalogs with an id greater than `after`, joined to their store's brand in the same
+        query, optionally filtered by brand, parse time and commit status."""
+    stmt = (select(Catalog.id, Brand.brand, Catalog.time_parsed, Catalog.alias, Catalog.comments, Catalog.commited,
+                   Catalog.error)
+            .join(Brand, Catalog.store_id == Brand.id))
+    if after is not None:
+        stmt = stmt.where(Catalog.id > after)
+    if brand is not None:
+        stmt = stmt.where(Brand.brand == brand)
+    if since is not None:
+        stmt = stmt.where(Catalog.time_parsed >= since)
+    if uncommitted:
+        stmt = stmt.where(Catalog.commited.is_(False))
 
-def add_catalog(brand_alias: str, alias: str, comments: str = None):
-    """Checks if `brand_alias` exists in the Brand table and adds it to the local database."""
     with SessionLocal() as session:
+        rows = session.execute(stmt.order_by(Catalog.id).limit(limit))
+        return [[str(id_), brand, str(time_parsed), alias or "", comments or "",
+                 '✅' if commited else '❌', '✅' if error else '❌']
+                for id_, brand, time_parsed, alias, comments, commited, error in rows]
+
+
+def add_catalog(brand_alias: str, alias: str, comments: str = None, validation: Validation = 'fast',
+                max_memory: int = None, session: Session = None):
+    """Checks if `brand_alias` exists in the Brand table and adds it to the local database. The products come from
+        the `ParseCache` when the same parser version already parsed this snapshot; 'strict' `validation` always
+        parses again. With `max_memory` in bytes, products are written in batches sized to fit the budget. Writes
+        join `session`'s transaction when one is given."""
+    from src.models.product_sync import batch_size_for
+
+    batch_size = CATALOG_BATCH_SIZE if max_memory is None else batch_size_for(max_memory)
+    with metrics.stage('add_catalog') as stage, write_session(session) as session:
         get_store: Brand | None = session.query(Brand).where(brand_alias == Brand.alias).first()
         if get_store is None:
             raise Exception(f"The alias `{brand_alias}` does not exist in Brand")
 
         catalog = Catalog(get_store.id, alias, comments)
+        session.add(catalog)
+        session.flush()
 
+        from utils.get_parser import get_store_obj
         store = get_store_obj(get_store.brand)
-        store.load_raw_data(get_store.data)
-        store.parse_file()
-
-        catalog.data = store.get_json()
-        #print(catalog.data)
+        store.validation = validation
+
+        data_hash = None if get_store.data is None else snapshot_hash(get_store.data)
+        cached = None if data_hash is None or validation == 'strict' else get_cached_parse(session, store, data_hash)
+        if cached is not None:
+            products = metrics.iter_stage('parse_cache', store.iter_load_data(cached))
+            stage.add(items=add_catalog_products(session, catalog.id, products, batch_size=batch_size))
+            return
+
+        store.raw_data = iter_snapshot(session, get_store.data)
+        packer = Packer()
+        products = metrics.iter_stage('parse', iter_packing(store.iter_products(), packer))
+        stage.add(items=add_catalog_products(session, catalog.id, products, batch_size=batch_size))
+        if data_hash is not None:
+            cache_parse(session, store, data_hash, packer.finish())
+
+
+def add_parsed_catalog(brand_alias: str, alias: str, comments: str = None,
+                       products: Iterable[Product] = (), session: Session = None) -> int:
+    """Adds a catalog of products that were already parsed, e.g. by `add stores` workers, to the store with
+        `brand_alias`. Returns how many products were written. Writes join `session`'s transaction when one is
+        given."""
+    with metrics.stage('add_catalog') as stage, write_session(session) as session:
+        store_id = session.scalar(select(Brand.id).where(Brand.alias == brand_alias))
+        if store_id is None:
+            raise Exception(f"The alias `{brand_alias}` does not exist in Brand")
 
+        catalog = Catalog(store_id, alias, comments)
         session.add(catalog)
-        session.commit()
-
-
-def commit_catalog(alias: str = None):
-    """Commits catalog to the remote database."""
-    with SessionLocal() as session:
+        session.flush()
+        count = add_catalog_products(session, catalog.id, products)
+        stage.add(items=count)
+    return count
+
+
+def commit_catalog(alias: str = None, max_memory: int = None, batch_size: int = None, writers: int = 0,
+                   queue_depth: int = None, loader: Loader = 'upsert'):
+    """Commits catalog to the remote database. With `max_memory` in bytes, products are read, upserted and released
+        in batches sized to fit the budget. With `writers`, the catalog is read while that many threads write it,
+        with at most `queue_depth` batches waiting. The 'copy' `loader` bulk loads into PostgreSQL with `COPY`, see
+        `Store.commit_products`."""
+    from src.models.product_sync import BATCH_SIZE, batch_size_for
+
+    if max_memory is not None:
+        batch_size = batch_size_for(max_memory)
+    batch_size = batch_size or BATCH_SIZE
+    options = dict(batch_size=batch_size, writers=writers, queue_depth=queue_depth, loader=loader)
+    with metrics.stage('commit_catalog'), SessionLocal() as session:
         cur_cat: Catalog | None = session.query(Catalog).where(alias == Catalog.alias).first()
         if cur_cat is None:
             raise Exception(f"Brand {alias} does not exist in store.")
 
+        from utils.get_parser import get_store_obj
         store = get_store_obj(cur_cat.store.brand)
-        store.load_data(cur_cat.data)
-        store.commit_products()
+        if cur_cat.data is not None:
+            store.commit_products(store.iter_load_data(cur_cat.data), max_memory=max_memory, **options)
+        else:
+            store.commit_products(iter_catalog_products(session, cur_cat.id, batch_size=batch_size),
+                                  max_memory=max_memory, **options)
 
         try:
             cur_cat.error = False
@@ -170,7 +629,12 @@ def delete_store(alias: str = None):
         if store is None:
             raise Exception(f"There is no store associated with the alias `{alias}`.")
 
+        session.execute(delete(CatalogProduct).where(
+            CatalogProduct.catalog_id.in_(select(Catalog.id).where(Catalog.store_id == store.id))))
         session.delete(store)
+        session.flush()
+        gc_blobs(session)
+        gc_parse_cache(session)
         session.commit()
 
 
@@ -181,15 +645,52 @@ def delete_catalog(alias: str = None):
         if cat is None:
             raise Exception(f"There is no catalog associated with the alias `{alias}`.")
 
+        session.execute(delete(CatalogProduct).where(CatalogProduct.catalog_id == cat.id))
         session.delete(cat)
         session.commit()
 
 
+def checkpoint_wal() -> None:
+    """Copies the pages held in the `-wal` file into the database file and truncates the log. Under WAL, writes and
+        even `VACUUM` only shrink or grow the database file once a checkpoint runs."""
+    with get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def compact() -> tuple[int, int, int]:
+    """Rewrites store rows as snapshot manifests and moves old catalog data into `catalog_product` rows, one row at
+        a time, then vacuums the file. Returns the number of rewritten rows and the file size before and after."""
+    db_file = Path(get_engine().url.database)
+    checkpoint_wal()
+    size_before = db_file.stat().st_size
+    rewritten = 0
+    with SessionLocal() as session:
+        for store_id in session.scalars(select(Brand.id)).all():
+            data = session.scalar(select(Brand.data).where(Brand.id == store_id))
+            if data is None or format_version(data) == MANIFEST_VERSION:
+                continue
+            manifest = save_snapshot(session, iter_unpack(data))
+            session.execute(update(Brand).where(Brand.id == store_id).values(data=manifest))
+            session.commit()
+            rewritten += 1
+
+        from src.models.store import Product
+        for catalog_id in session.scalars(select(Catalog.id).where(Catalog.data.is_not(None))).all():
+            data = session.scalar(select(Catalog.data).where(Catalog.id == catalog_id))
+            add_catalog_products(session, catalog_id, (Product(**p) for p in iter_unpack(data)))
+            session.execute(update(Catalog).where(Catalog.id == catalog_id).values(data=None))
+            session.commit()
+            rewritten += 1
+
+    with get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("VACUUM")
+    checkpoint_wal()
+    return rewritten, size_before, db_file.stat().st_size
+
+
 def main() -> None:
     pass
 
 
 if __name__ == "__main__":
     main()
-else:
-    Base.metadata.create_all(bind=get_local_engine())  # used to create local_settings.sqlite3 file if doesn't exist.
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import csv
+import io
+from typing import TYPE_CHECKING, Iterable, List
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from src.models.product_sync import CHILD_TABLES, PRODUCT_COLUMNS, CommitStats, batched, product_row
+from src.models.productsql import ProductSQL
+
+if TYPE_CHECKING:
+    from src.models.store import Product
+
+COPY_BATCH_SIZE = 10_000
+"""Products buffered in memory per `COPY` round trip."""
+
+NULL = r"\N"
+"""How `None` is written in the CSV buffers, since the csv module can't tell it apart from an empty string."""
+
+STAGING_COLUMNS = PRODUCT_COLUMNS + ["fingerprint"]
+
+STAGING_TABLES = [
+    f"CREATE TEMPORARY TABLE staging_product ({', '.join(f'{c} TEXT' for c in STAGING_COLUMNS)}, "
+    f"written BOOLEAN NOT NULL DEFAULT FALSE) ON COMMIT DROP",
+    "CREATE TEMPORARY TABLE staging_child (child_table TEXT NOT NULL, store_product_id TEXT NOT NULL, "
+    "value TEXT NOT NULL) ON COMMIT DROP",
+]
+"""Every staged value is TEXT and cast once during the merge, so the CSV needs no per-type formatting."""
+
+
+def copy_rows(session: Session, table: str, columns: List[str], rows: Iterable[list]) -> None:
+    """Streams `rows` into `table` with one `COPY ... FROM STDIN` through an in-memory CSV buffer."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerows([NULL if value is None else value for value in row] for row in rows)
+    buffer.seek(0)
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '{NULL}')",
+                           buffer)
+    finally:
+        cursor.close()
+
+
+def stage_batch(session: Session, batch: List[Product]) -> None:
+    """Copies a batch of products and their size, image and color values into the staging tables."""
+    copy_rows(session, "staging_product", STAGING_COLUMNS,
+              ([row[c] for c in STAGING_COLUMNS] for row in map(product_row, batch)))
+    copy_rows(session, "staging_child", ["child_table", "store_product_id", "value"],
+              ([model.__tablename__, p.store_product_id, value]
+               for model, _, values in CHILD_TABLES for p in batch for value in dict.fromkeys(values(p))))
+
+
+def merge_products(session: Session, brand: str) -> CommitStats:
+    """Merges `staging_product` into `product` with set-based statements: changed rows are updated, unchanged
+        inactive rows reactivated and new rows inserted. Staged rows that are new or changed are flagged `written`."""
+    columns = ", ".join(PRODUCT_COLUMNS + ["fingerprint"])
+    casts = {"price": "::double precision", "on_sale": "::boolean"}
+    selected = ", ".join(f"s.{c}{casts.get(c, '')}" for c in PRODUCT_COLUMNS + ["fingerprint"])
+    assignments = ", ".join(f"{c} = s.{c}{casts.get(c, '')}" for c in PRODUCT_COLUMNS + ["fingerprint"]
+                            if c != "store_product_id")
+    product = ProductSQL.__tablename__
+    params = {"brand": brand}
+
+    staged = session.execute(text("SELECT count(*) FROM staging_product")).scalar()
+    session.execute(text(f"""
+        UPDATE staging_product s SET written = TRUE
+        WHERE NOT EXISTS (SELECT 1 FROM {product} p
+                          WHERE p.store_product_id = s.store_product_id AND p.fingerprint = s.fingerprint)"""))
+    updated = session.execute(text(f"""
+        UPDATE {product} p SET {assignments}, time_scraped = statement_timestamp(), active = TRUE
+        FROM staging_product s
+        WHERE p.store_product_id = s.store_product_id AND s.written""")).rowcount
+    session.execute(text(f"""
+        UPDATE {product} p SET active = TRUE
+        FROM staging_product s
+        WHERE p.store_product_id = s.store_product_id AND NOT s.written AND NOT p.active"""))
+    inserted = session.execute(text(f"""
+        INSERT INTO {product} ({columns}, active)
+        SELECT {selected}, TRUE FROM staging_product s
+        WHERE NOT EXISTS (SELECT 1 FROM {product} p WHERE p.store_product_id = s.store_product_id)""")).rowcount
+    deactivated = session.execute(text(f"""
+        UPDATE {product} p SET active = FALSE
+        WHERE p.brand = :brand AND p.active
+          AND NOT EXISTS (SELECT 1 FROM staging_product s WHERE s.store_product_id = p.store_product_id)"""),
+        params).rowcount
+    return CommitStats(inserted=inserted, updated=updated, unchanged=staged - inserted - updated,
+                       deactivated=deactivated)
+
+
+def merge_children(session: Session) -> None:
+    """Brings the child rows of the `written` products in line with `staging_child`: values that disappeared are
+        deleted and new values inserted, one statement each per child table."""
+    product = ProductSQL.__tablename__
+    for model, column, _ in CHILD_TABLES:
+        child = model.__tablename__
+        session.execute(text(f"""
+            DELETE FROM {child} c
+            USING {product} p, staging_product s
+            WHERE c.product_uid = p.uid AND p.store_product_id = s.store_product_id AND s.written
+              AND NOT EXISTS (SELECT 1 FROM staging_child v
+                              WHERE v.child_table = :child AND v.store_product_id = s.store_product_id
+                                AND v.value = c.{column})"""), {"child": child})
+        session.execute(text(f"""
+            INSERT INTO {child} (product_uid, {column})
+            SELECT p.uid, v.value
+            FROM staging_child v
+            JOIN staging_product s ON s.store_product_id = v.store_product_id AND s.written
+            JOIN {product} p ON p.store_product_id = v.store_product_id
+            WHERE v.child_table = :child
+              AND NOT EXISTS (SELECT 1 FROM {child} c WHERE c.product_uid = p.uid AND c.{column} = v.value)"""),
+            {"child": child})
+
+
+def commit_copy(session: Session, brand: str, products: Iterable[Product],
+                batch_size: int = COPY_BATCH_SIZE) -> CommitStats:
+    """Syncs the `product` table to the full catalog of `brand` inside the caller's transaction, like
+        `commit_batches`, but loads the catalog with PostgreSQL `COPY` into temporary staging tables and merges it
+        with a handful of set-based statements instead of one upsert per batch. Requires psycopg2."""
+    if session.get_bind().dialect.name != "postgresql":
+        raise Exception("The copy loader needs a PostgreSQL database.")
+
+    for statement in STAGING_TABLES:
+        session.execute(text(statement))
+
+    seen = set()
+    for batch in batched(products, batch_size):
+        batch = [p for p in {p.store_product_id: p for p in batch}.values() if p.store_product_id not in seen]
+        seen.update(p.store_product_id for p in batch)
+        stage_batch(session, batch)
+
+    session.execute(text("CREATE INDEX ON staging_product (store_product_id)"))
+    session.execute(text("CREATE INDEX ON staging_child (child_table, store_product_id)"))
+    session.execute(text("ANALYZE staging_product"))
+    session.execute(text("ANALYZE staging_child"))
+
+    stats = merge_products(session, brand)
+    merge_children(session)
+    return stats
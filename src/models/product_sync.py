@@ -0,0 +1,340 @@
+from __future__ import annotations
+
+import queue
+import threading
+import uuid
+from datetime import datetime
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import Column, MetaData, Table, delete, select, update
+from sqlalchemy.dialects.postgresql import TEXT
+from sqlalchemy.orm import Session, sessionmaker
+
+from src.models.productsql import ProductSQL, ProductColorSQL, ProductImageSQL, ProductSizeSQL
+from utils.metrics import metrics
+
+if TYPE_CHECKING:
+    from src.models.store import Product
+
+BATCH_SIZE = 1000
+"""Default number of products written per upsert statement."""
+
+QUEUE_DEPTH = 4
+"""Default number of batches the pipelined commit lets the parser get ahead of the writers."""
+
+STAGE_QUERY_SIZE = 5000
+"""Ids inserted per statement when staging a pipelined commit's ids for the sweep."""
+
+PRODUCT_COLUMNS = ["product_name", "brand", "category", "gender", "price", "on_sale", "store_product_id",
+                   "main_image_url", "product_url"]
+"""`Product` fields that map one-to-one onto `product` columns."""
+
+PRODUCT_MEMORY_ESTIMATE = 32 * 1024
+"""Rough peak bytes per product held while a batch is written and its child rows are diffed. `--profile-memory`
+    reports about 18 KB of traced allocations per product for 1000-product batches; the rest is headroom for
+    allocator overhead."""
+
+MIN_BATCH_SIZE = 50
+
+
+def batch_size_for(max_memory: int) -> int:
+    """Picks a batch size whose working set fits in half of `max_memory`, leaving the rest for the interpreter,
+        SQLAlchemy and the database driver."""
+    return max(MIN_BATCH_SIZE, min(BATCH_SIZE, max_memory // 2 // PRODUCT_MEMORY_ESTIMATE))
+
+
+incoming_products = Table(
+    "incoming_product", MetaData(),
+    Column("store_product_id", TEXT, primary_key=True),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DROP",
+)
+"""Temporary staging table holding the `store_product_id`s of the catalog being committed."""
+
+
+class CommitStats(BaseModel):
+    """Counts of what a commit did to the `product` table."""
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deactivated: int = 0
+
+    def __str__(self) -> str:
+        return (f"inserted={self.inserted} updated={self.updated} unchanged={self.unchanged} "
+                f"deactivated={self.deactivated}")
+
+
+def batched(products: Iterable[Product], batch_size: int = BATCH_SIZE) -> Iterator[List[Product]]:
+    """Splits a product stream into lists of at most `batch_size` products."""
+    batch = []
+    for product in products:
+        batch.append(product)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def get_insert(session: Session):
+    """Returns the dialect's `insert` so that `on_conflict_do_update` is available for both PostgreSQL and the
+        SQLite stand-in used for local runs."""
+    return dialect_insert(session.get_bind().dialect.name)
+
+
+def dialect_insert(dialect: str):
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert
+
+
+@lru_cache(maxsize=None)
+def upsert_statement(dialect: str):
+    """The `INSERT ... ON CONFLICT (store_product_id) DO UPDATE ... RETURNING` of `upsert_products`, built once
+        per dialect and executed with a list of rows, so that it is compiled once and SQLAlchemy's
+        insertmanyvalues batches the rows into multi-row statements."""
+    stmt = dialect_insert(dialect)(ProductSQL.__table__)
+    updated = PRODUCT_COLUMNS + ["fingerprint", "time_scraped", "active"]
+    return stmt.on_conflict_do_update(
+        index_elements=[ProductSQL.store_product_id],
+        set_={c: stmt.excluded[c] for c in updated if c != "store_product_id"},
+    ).returning(ProductSQL.store_product_id, ProductSQL.uid, sort_by_parameter_order=True)
+
+
+class ExistingProduct(NamedTuple):
+    """What a commit needs to know about a product that is already in the remote database."""
+    uid: uuid.UUID
+    fingerprint: Optional[str]
+    active: bool
+
+
+def get_existing(session: Session, brand: str, store_product_ids: List[str] = None) -> Dict[str, ExistingProduct]:
+    """Fetches the uid, fingerprint and active flag of every product of `brand` in one query, or only of the
+        given `store_product_ids`."""
+    stmt = select(ProductSQL.store_product_id, ProductSQL.uid, ProductSQL.fingerprint,
+                  ProductSQL.active).where(ProductSQL.brand == brand)
+    if store_product_ids is not None:
+        stmt = stmt.where(ProductSQL.store_product_id.in_(store_product_ids))
+    rows = session.execute(stmt)
+    return {store_product_id: ExistingProduct(uid, fingerprint, active)
+            for store_product_id, uid, fingerprint, active in rows}
+
+
+def product_row(product: Product) -> dict:
+    """Converts a `Product` into the column values of its `product` row."""
+    row = {column: getattr(product, column) for column in PRODUCT_COLUMNS}
+    row["fingerprint"] = product.fingerprint()
+    return row
+
+
+def upsert_products(session: Session, batch: List[Product], existing: Dict[str, ExistingProduct],
+                    stats: CommitStats) -> tuple[List[Product], Dict[str, uuid.UUID]]:
+    """Writes the new and changed products of a batch with a single
+        `INSERT ... ON CONFLICT (store_product_id) DO UPDATE`. Products whose fingerprint matches `existing` are
+        left alone. Returns the written products and their `store_product_id -> uid` map."""
+    written = []
+    rows = []
+    reactivate = []
+    for product in batch:
+        row = product_row(product)
+        old = existing.get(product.store_product_id)
+        if old is None:
+            stats.inserted += 1
+        elif old.fingerprint != row["fingerprint"]:
+            stats.updated += 1
+        else:
+            stats.unchanged += 1
+            if not old.active:
+                reactivate.append(old.uid)
+            continue
+        written.append(product)
+        rows.append(row)
+
+    uids = {}
+    if rows:
+        now = datetime.now()
+        stmt = upsert_statement(session.get_bind().dialect.name)
+        result = session.execute(stmt, [{**row, "uid": uuid.uuid4(), "time_scraped": now, "active": True}
+                                        for row in rows])
+        uids = {store_product_id: uid for store_product_id, uid in result}
+
+    if reactivate:
+        session.execute(update(ProductSQL).where(ProductSQL.uid.in_(reactivate)).values(active=True))
+    return written, uids
+
+
+CHILD_TABLES = [
+    (ProductSizeSQL, "size", lambda p: p.sizes_raw),
+    (ProductImageSQL, "image_url", lambda p: p.images_raw or []),
+    (ProductColorSQL, "color", lambda p: p.colors_raw or []),
+]
+"""Child model, value column and the `Product` field it is filled from."""
+
+
+def sync_children(session: Session, batch: List[Product], uids: Dict[str, uuid.UUID]) -> None:
+    """Brings the size, image and color rows of the given products in line with the incoming values.
+
+    Each child table is read once for the whole batch; only rows that disappeared are deleted and only values
+    that are new are inserted, with bulk core statements.
+    """
+    if not batch:
+        return
+    product_uids = [uids[p.store_product_id] for p in batch]
+    for model, column, values in CHILD_TABLES:
+        value_column = model.__table__.c[column]
+        current: Dict[tuple, uuid.UUID] = {}
+        stale = []
+        for uid, product_uid, value in session.execute(
+                select(model.uid, model.product_uid, value_column).where(model.product_uid.in_(product_uids))):
+            if (product_uid, value) in current:
+                stale.append(uid)
+            else:
+                current[(product_uid, value)] = uid
+
+        incoming = {(uids[p.store_product_id], value) for p in batch for value in values(p)}
+        stale += [uid for key, uid in current.items() if key not in incoming]
+        rows = [{"uid": uuid.uuid4(), "product_uid": product_uid, column: value}
+                for product_uid, value in incoming if (product_uid, value) not in current]
+
+        if stale:
+            session.execute(delete(model).where(model.uid.in_(stale)))
+        if rows:
+            session.execute(get_insert(session)(model.__table__), rows)
+
+
+def stage_ids(session: Session, batch: List[Product]) -> None:
+    """Records the batch's `store_product_id`s in the `incoming_product` staging table."""
+    stmt = get_insert(session)(incoming_products).on_conflict_do_nothing()
+    session.execute(stmt, [{"store_product_id": p.store_product_id} for p in batch])
+
+
+def sweep_inactive(session: Session, brand: str) -> int:
+    """Deactivates the active products of `brand` that aren't in the staging table and returns how many."""
+    staged = select(incoming_products.c.store_product_id).where(
+        incoming_products.c.store_product_id == ProductSQL.store_product_id)
+    result = session.execute(update(ProductSQL)
+                             .where(ProductSQL.brand == brand, ProductSQL.active.is_(True), ~staged.exists())
+                             .values(active=False))
+    return result.rowcount
+
+
+def commit_batches(session: Session, brand: str, products: Iterable[Product],
+                   batch_size: int = BATCH_SIZE, chunked: bool = False) -> CommitStats:
+    """Syncs the `product` table to the full catalog of `brand` inside the caller's transaction.
+
+    New and changed products, found by fingerprint, are upserted in batches of `batch_size` and their child rows
+    are diffed against what is stored; unchanged products are left alone. Every incoming id is staged in a
+    temporary table so that the products missing from the catalog can be deactivated with one set-based `UPDATE`
+    at the end, in the same transaction.
+
+    `chunked` looks up the stored fingerprints one batch at a time instead of for the whole brand up front, so that
+    memory stays bounded by `batch_size` at the cost of one more query per batch.
+    """
+    stats = CommitStats()
+    connection = session.connection()
+    incoming_products.drop(connection, checkfirst=True)
+    incoming_products.create(connection)
+
+    existing = {} if chunked else get_existing(session, brand)
+    seen = set()
+    for batch in batched(products, batch_size):
+        batch = [p for p in {p.store_product_id: p for p in batch}.values() if p.store_product_id not in seen]
+        seen.update(p.store_product_id for p in batch)
+        if not batch:
+            continue
+        if chunked:
+            existing = get_existing(session, brand, [p.store_product_id for p in batch])
+        stage_ids(session, batch)
+        written, uids = upsert_products(session, batch, existing, stats)
+        sync_children(session, written, uids)
+
+    stats.deactivated = sweep_inactive(session, brand)
+    incoming_products.drop(connection, checkfirst=True)
+    return stats
+
+
+def write_batch(session_factory: sessionmaker, brand: str, batch: List[Product]) -> CommitStats:
+    """Upserts one batch and syncs its child rows in a transaction of its own."""
+    stats = CommitStats()
+    with metrics.stage('write_batch'), session_factory.begin() as session:
+        existing = get_existing(session, brand, [p.store_product_id for p in batch])
+        written, uids = upsert_products(session, batch, existing, stats)
+        sync_children(session, written, uids)
+    return stats
+
+
+def commit_pipelined(session_factory: sessionmaker, brand: str, products: Iterable[Product],
+                     batch_size: int = BATCH_SIZE, writers: int = 2, queue_depth: int = QUEUE_DEPTH) -> CommitStats:
+    """Syncs the `product` table to the full catalog of `brand` while the catalog is still being read.
+
+    The calling thread pulls products from `products` and hands batches to `writers` threads through a queue of at
+    most `queue_depth` batches, so parsing overlaps with database waits and blocks, rather than buffering, when the
+    writers fall behind. Each writer commits every batch in its own transaction on its own pooled connection.
+
+    Unlike `commit_batches` this is not atomic: batches written before a failure stay committed. The sweep that
+    deactivates products missing from the catalog only runs once every batch succeeded, so a failed run never
+    deactivates anything and can simply be run again.
+    """
+    batches: queue.Queue[Optional[List[Product]]] = queue.Queue(maxsize=queue_depth)
+    stats = CommitStats()
+    stats_lock = threading.Lock()
+    errors: List[Exception] = []
+
+    def write():
+        while (batch := batches.get()) is not None:
+            if errors:
+                continue
+            try:
+                batch_stats = write_batch(session_factory, brand, batch)
+            except Exception as e:
+                errors.append(e)
+                continue
+            with stats_lock:
+                stats.inserted += batch_stats.inserted
+                stats.updated += batch_stats.updated
+                stats.unchanged += batch_stats.unchanged
+
+    # Creates the engine and pool before the writer threads race to do it.
+    with session_factory() as session:
+        session.connection()
+
+    threads = [threading.Thread(target=write, name=f"commit-writer-{i}", daemon=True) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+
+    seen = set()
+    try:
+        for batch in batched(products, batch_size):
+            batch = [p for p in {p.store_product_id: p for p in batch}.values() if p.store_product_id not in seen]
+            seen.update(p.store_product_id for p in batch)
+            while batch and not errors:
+                try:
+                    batches.put(batch, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            if errors:
+                break
+    finally:
+        for _ in threads:
+            batches.put(None)
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+
+    with session_factory.begin() as session:
+        connection = session.connection()
+        incoming_products.drop(connection, checkfirst=True)
+        incoming_products.create(connection)
+        ids = list(seen)
+        for start in range(0, len(ids), STAGE_QUERY_SIZE):
+            session.execute(incoming_products.insert(),
+                            [{"store_product_id": i} for i in ids[start:start + STAGE_QUERY_SIZE]])
+        stats.deactivated = sweep_inactive(session, brand)
+        incoming_products.drop(connection, checkfirst=True)
+    return stats
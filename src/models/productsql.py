@@ -1,12 +1,10 @@
 from sqlalchemy import Uuid, TIMESTAMP, Boolean, Double
-from sqlalchemy import ForeignKey, Column
+from sqlalchemy import ForeignKey, Column, Engine, inspect, text
 from sqlalchemy.dialects.postgresql import TEXT
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.sql import func
 
-from utils.db_utils import get_remote_engine
-
 
 # declarative base class
 class Base(DeclarativeBase):
@@ -38,6 +36,8 @@ class ProductSQL(Base):
     """Type of product. Ex. Tops, Bottoms, Skirts."""
     active = Column("active", Boolean, nullable=False, default=True)
     """Boolean that determines if the product still exists or not."""
+    fingerprint = Column("fingerprint", TEXT, nullable=True)
+    """Content hash of the scraped product (`Product.fingerprint`), used to skip rewriting unchanged products."""
 
     sizes = relationship("ProductSizeSQL", backref="product", cascade='all, delete-orphan')
     """One-to-many relation of sizes. Ex. 'S', 'M', 'US-30'."""
@@ -95,11 +95,22 @@ class ProductSizeSQL(Base):
         return f"ProductSizeSQL(uid={self.uid}, size={self.size})"
 
 
+def migrate(engine: Engine) -> None:
+    """Creates missing tables and adds any model columns that an existing table doesn't have yet."""
+    Base.metadata.create_all(bind=engine)
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} '
+                                      f'{column.type.compile(engine.dialect)}'))
+
+
 def main():
     pass
 
 
 if __name__ == '__main__':
     main()
-else:
-    Base.metadata.create_all(bind=get_remote_engine())
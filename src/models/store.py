@@ -1,18 +1,33 @@
+import hashlib
 import json
 from pathlib import Path
 from datetime import datetime
 
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
 
+from src.models.product_sync import (BATCH_SIZE, QUEUE_DEPTH, CommitStats, batch_size_for, commit_batches,
+                                      commit_pipelined)
 from src.models.productsql import ProductSQL, ProductColorSQL, ProductImageSQL, ProductSizeSQL
 
-from typing import List, Optional, Literal
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Literal
 from pydantic import BaseModel, Json
 
+from utils.codec import iter_unpack
 from utils.db_utils import SessionRemote
+from utils.http_cache import ResponseCache
+from utils.metrics import metrics
+
+if TYPE_CHECKING:
+    from src.local_settings.local_database import Checkpoint
 
 Extension = Literal['json', 'csv']
 
+Validation = Literal['fast', 'strict']
+"""'fast' lets parsers trust the shape of scraped data and skip validation, 'strict' validates every item."""
+
+Loader = Literal['upsert', 'copy']
+"""'upsert' writes batches of `INSERT ... ON CONFLICT` on any database, 'copy' bulk loads with PostgreSQL `COPY`."""
+
 
 class Product(BaseModel):
     """Instantiates Product object before it becomes an SQLAlchemy object. Validated by Pydantic."""
@@ -35,9 +50,19 @@ class Product(BaseModel):
     extra: Optional[Json] = None
     """Used to add additional metadata as Jsonb data into the PostgreSQL `product` table."""
 
+    def fingerprint(self) -> str:
+        """Stable hash of everything a commit writes for this product, stored in `ProductSQL.fingerprint`."""
+        content = [self.product_name, self.category, self.gender, self.price, self.on_sale, self.main_image_url,
+                   self.product_url, self.sizes_raw, self.colors_raw or [], self.images_raw or []]
+        return hashlib.blake2b(json.dumps(content, separators=(',', ':')).encode(), digest_size=16).hexdigest()
+
 
 class Store(object):
     """Defines a Store object that can be extended to create a custom parser."""
+    parser_version: int = 1
+    """Bump whenever a change to `iter_products` changes the products it yields, so that `add catalog` parses
+    snapshots again instead of reusing products cached by the previous version."""
+
     def __init__(self, brand: str):
         self.raw_data = None
         """Raw data from scraping as a dictionary."""
@@ -46,12 +71,30 @@ class Store(object):
         """List os SQLALchemy `product` objects."""
         self.products: List[Product] = []
         """List of Pydantic `product` objects."""
+        self.validation: Validation = 'fast'
+        """How thoroughly `iter_products` validates raw data. Use 'strict' to debug malformed scrapes."""
 
-    def get_data(self, local_data=False):
+    def get_data(self, local_data=False, max_workers: int = 8, cache: ResponseCache = None):
         """This class must get data from some source, internal API scrape, selenium, etc, and save it in
-            self.raw_data. """
+            self.raw_data. `max_workers` caps how many requests a parser may have in flight at once. HTTP
+            requests should go through `cache`, and `local_data` should replay cached responses only."""
         raise NotImplemented("Must be overridden by custom Parser.")
 
+    def iter_data(self, local_data=False, max_workers: int = 8, cache: ResponseCache = None,
+                  checkpoint: "Checkpoint" = None) -> Iterator:
+        """Yields the raw data in `(items, category)` batches without holding all of it in memory. Parsers that
+            can fetch incrementally should override this; by default it walks `get_data`. The result can be
+            assigned to `self.raw_data` so that `parse_file` consumes it as it arrives.
+
+        With a `checkpoint`, every page is passed to `checkpoint.save` as soon as it is fetched. Parsers that
+            paginate should also skip the pages in `checkpoint.done()`; this default can't, so a resumed scrape
+            fetches everything again."""
+        for index, (items, category) in enumerate(self.get_data(local_data=local_data, max_workers=max_workers,
+                                                                cache=cache)):
+            if checkpoint is not None:
+                checkpoint.save((index,), None, items, category)
+            yield items, category
+
     def add_product(self, product: Product):
         """Add product object to SQLAlchemy list of objects in `self.sqlproducts`"""
         product.brand = self.brand
@@ -69,47 +112,59 @@ class Store(object):
         #self.products.append(product)
         self.sqlproducts.append(product_model)
 
+    def iter_products(self) -> Iterator[Product]:
+        """This generator must convert `self.raw_data` into `Product` objects one at a time, skipping duplicates."""
+        raise NotImplementedError("Must be overridden by custom Parser.")
+
     def parse_file(self) -> None:
-        """This class must convert `self.raw_data` into `self.products`"""
-        pass
+        """Converts `self.raw_data` into `self.products`."""
+        self.products.extend(metrics.iter_stage('parse', self.iter_products()))
 
     def print_products(self) -> None:
         """Prints all products for debugging."""
         for product in self.products:
             print(product)
 
-    def commit_products(self) -> None:
-        """This commits products to remote database."""
-        for product in self.products:
-            self.add_product(product)
-
-        unique_prods = 0
-        with SessionRemote() as session:
-            session.query(ProductSQL).filter(self.brand == ProductSQL.brand).update({"active": False})
-            session.commit()
-
-        for product in self.sqlproducts:
-            session = SessionRemote()
-            session.begin()
-            try:
-                session.add(product)
-                session.commit()
-                unique_prods += 1
-            except IntegrityError:
-                session.rollback()
-                # Query for the existing item that caused the unique constraint violation
-                existing_item = session.query(ProductSQL).filter_by(
-                    store_product_id=product.store_product_id).one()
-
-                # Compare time_scraped and update if the new item is more recent
-                #if product.time_scraped is not None and product.time_scraped > existing_item.time_scraped:
-                existing_item.data = product
-                existing_item.time_scraped = datetime.now()
-                existing_item.active = True
-                session.commit()
-            finally:
-                session.close()
-        print(f"Unique products committed: {unique_prods}")
+    def commit_products(self, products: Iterable[Product] = None, batch_size: int = BATCH_SIZE,
+                        session_factory: sessionmaker = None, max_memory: int = None, writers: int = 0,
+                        queue_depth: int = None, loader: Loader = 'upsert') -> CommitStats:
+        """This commits products to remote database, defaulting to `self.products`. Products are upserted
+            `batch_size` at a time and the brand's products missing from the catalog are deactivated, all in one
+            transaction. With `max_memory` in bytes, the batch size is derived from the budget and stored
+            fingerprints are looked up per batch. With `writers`, batches are written by that many threads while
+            the products are still being read, one transaction per batch (see `commit_pipelined`). The 'copy'
+            `loader` stages the whole catalog with `COPY` and merges it in one transaction (see `commit_copy`), so
+            it can't be combined with `writers` or `queue_depth`."""
+        if loader == 'copy' and (writers or queue_depth is not None):
+            raise Exception("The copy loader writes in one transaction and can't be combined with writers or a "
+                            "queue depth.")
+        session_factory = SessionRemote if session_factory is None else session_factory
+        if max_memory is not None:
+            batch_size = batch_size_for(max_memory)
+
+        products = self._with_brand(self.products if products is None else products)
+        with metrics.stage('commit_products') as stage:
+            if loader == 'copy':
+                from src.models.product_copy import COPY_BATCH_SIZE, commit_copy
+
+                with session_factory.begin() as session:
+                    stats = commit_copy(session, self.brand, products,
+                                        batch_size=COPY_BATCH_SIZE if max_memory is None else batch_size)
+            elif writers:
+                stats = commit_pipelined(session_factory, self.brand, products, batch_size=batch_size,
+                                         writers=writers, queue_depth=queue_depth or QUEUE_DEPTH)
+            else:
+                with session_factory.begin() as session:
+                    stats = commit_batches(session, self.brand, products, batch_size=batch_size,
+                                           chunked=max_memory is not None)
+            stage.add(items=stats.inserted + stats.updated + stats.unchanged)
+        print(f"Products committed: {stats}")
+        return stats
+
+    def _with_brand(self, products: Iterable[Product]) -> Iterator[Product]:
+        for product in products:
+            product.brand = self.brand
+            yield product
 
     def save_file(self, data: any, extension: Extension, alias: Optional[str] = ""):
         """Saves parse in parser's file location."""
@@ -124,30 +179,37 @@ class Store(object):
         with new_file.open("w", encoding="utf-8") as f:
             f.write(data)
 
-    def save_raw_json(self):
+    def save_raw_json(self, products: Iterable[Product] = None):
         """Saves raw json file in parser's file location."""
-        products_json = [product.model_dump(exclude_unset=True) for product in self.products]
-        json_str = json.dumps(products_json, indent=2)
-
-        self.save_file(json_str, "json", alias="_raw")
+        self.save_file(self.get_json(products), "json", alias="_raw")
 
-    def save_json(self):
+    def save_json(self, products: Iterable[Product] = None):
         """Saves raw json in parser's file location."""
-        products_json = [product.model_dump(exclude_unset=True) for product in self.products]
-        json_str = json.dumps(products_json, indent=2)
-        self.save_file(json_str, "json", alias="_parse")
-
-    def load_raw_data(self, json_str: str) -> None:
-        products_json = json.loads(json_str)
-        print(products_json)
-        self.raw_data = products_json
-
-    def load_data(self, json_str: str) -> None:
-        products_json = json.loads(json_str)
-        for p in products_json:
-            print(p)
-            self.products.append(Product(**p))
-
-    def get_json(self):
-        products_json = [product.model_dump(exclude_unset=True) for product in self.products]
-        return json.dumps(products_json, indent=2)
+        self.save_file(self.get_json(products), "json", alias="_parse")
+
+    def load_raw_data(self, data: bytes | str | Path) -> None:
+        """Loads raw data stored by `add store`, packed, as legacy JSON text or from a JSON file. The pages are
+            decoded lazily as `iter_products` consumes them."""
+        self.raw_data = iter_unpack(data)
+
+    def iter_load_data(self, data: bytes | str | Path) -> Iterator[Product]:
+        """Yields parsed products stored by `add catalog`, decoding them one at a time."""
+        for p in iter_unpack(data):
+            yield Product(**p)
+
+    def load_data(self, data: bytes | str | Path) -> None:
+        """Loads parsed products stored by `add catalog`, either packed or as legacy JSON text."""
+        self.products.extend(self.iter_load_data(data))
+
+    def dump_products(self, products: Iterable[Product] = None) -> List[dict]:
+        """Dumps `products`, e.g. a stream from `iter_products`, or `self.products` by default."""
+        return [product.model_dump(exclude_unset=True)
+                for product in (self.products if products is None else products)]
+
+    def get_json(self, products: Iterable[Product] = None):
+        """Serializes products as indented JSON for files."""
+        with metrics.stage('get_json') as stage:
+            dumped = self.dump_products(products)
+            data = json.dumps(dumped, indent=2)
+            stage.add(items=len(dumped), bytes=len(data))
+        return data
@@ -0,0 +1,49 @@
+import random
+import time
+import unittest
+from unittest import mock
+
+import src.Stores.Uniqlo.uniqlo as uniqlo
+
+CATEGORIES = {"men": {"1": "tops", "2": "pants", "3": "socks"}, "women": {"4": "dresses"}}
+SIZES = {"1": 300, "2": 70, "3": 200, "4": 200}
+IGNORES_OFFSET = {"3"}
+"""Categories for which the stub API ignores `offset` and reports no total, returning the first page forever."""
+
+
+def stub_get_json(session, url, params=None, timeout=30, cache=None, decode=None):
+    category_id, offset = params["categoryIds"], int(params["offset"])
+    time.sleep(random.random() * (0.03 if category_id == "1" else 0.01))
+    if category_id in IGNORES_OFFSET:
+        offset = 0
+    ids = [f"{category_id}-{i}" for i in range(offset, min(offset + int(params["limit"]), SIZES[category_id]))]
+    if (category_id, offset) in (("1", 2 * uniqlo.PAGE_SIZE), ("2", 0)):
+        ids[0] = "shared"
+    result = {"items": [{"productId": i} for i in ids]}
+    if category_id not in IGNORES_OFFSET:
+        result["pagination"] = {"total": SIZES[category_id]}
+    return decode({"result": result})
+
+
+@mock.patch.object(uniqlo, "get_json", stub_get_json)
+@mock.patch.object(uniqlo, "get_categories", lambda: CATEGORIES)
+class PaginationTest(unittest.TestCase):
+    def test_pages_come_category_by_category_whatever_the_workers(self):
+        orders = []
+        for max_workers in (1, 8):
+            pages = list(uniqlo.iter_api_data(max_workers=max_workers))
+            orders.append([(category, [item["productId"] for item in items]) for items, category in pages])
+        self.assertEqual(orders[0], orders[1])
+        categories = [category for category, _ in orders[0]]
+        self.assertEqual(categories, sorted(categories, key=["tops", "pants", "socks", "dresses"].index))
+
+    def test_repeated_page_is_dropped(self):
+        pages = list(uniqlo.iter_api_data(max_workers=4))
+        socks = [items for items, category in pages if category == "socks"]
+        self.assertEqual(len(socks), 1)
+        ids = [item["productId"] for items, _ in pages for item in items]
+        self.assertEqual(len(ids), len(set(ids)) + 1)  # "shared" is listed in both tops and pants
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import json
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from sqlalchemy import create_engine, select
+
+import src.local_settings.local_database as db
+import src.Stores.Uniqlo.uniqlo as uniqlo
+from utils.db_utils import LazySessionmaker
+from utils.http_cache import ResponseCache
+
+CATEGORIES = {"men": {"1": "tops"}, "women": {"2": "dresses"}}
+ITEMS_PER_CATEGORY = 150
+
+
+class StubApi(BaseHTTPRequestHandler):
+    """Serves `ITEMS_PER_CATEGORY` items per category, `PAGE_SIZE` at a time, and answers the pages in `bad` once
+        with an error payload and status 200."""
+    requests = []
+    bad = set()
+
+    def do_GET(self):
+        query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        page = (query["categoryIds"], int(query["offset"]))
+        self.requests.append(page)
+        if page in self.bad:
+            self.bad.discard(page)
+            payload = {"status": "error", "message": "Service unavailable"}
+        else:
+            category_id, offset = page
+            items = [{"productId": f"{category_id}-{i}"}
+                     for i in range(offset, min(offset + int(query["limit"]), ITEMS_PER_CATEGORY))]
+            payload = {"result": {"items": items, "pagination": {"total": ITEMS_PER_CATEGORY}}}
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubUniqlo(uniqlo.Uniqlo):
+    def __init__(self, url: str, cache: ResponseCache):
+        super().__init__()
+        self.url = url
+        self.cache = cache
+
+    def iter_data(self, local_data=False, max_workers: int = 2, cache: ResponseCache = None, checkpoint=None):
+        return uniqlo.iter_api_data(url=self.url, max_workers=max_workers, cache=self.cache, checkpoint=checkpoint)
+
+
+class ResumeTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+
+        engine = create_engine(f"sqlite:///{self.tmp / 'local.sqlite3'}")
+        db.Base.metadata.create_all(bind=engine)
+        self.addCleanup(engine.dispose)
+        patcher = mock.patch.object(db, "SessionLocal", LazySessionmaker(lambda: engine))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(uniqlo, "get_categories", lambda: CATEGORIES)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        StubApi.requests = []
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubApi)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = f"http://127.0.0.1:{server.server_port}/api"
+
+    def store(self) -> StubUniqlo:
+        return StubUniqlo(self.url, ResponseCache(self.tmp / "http_cache"))
+
+    def test_resume_refetches_a_bad_200_page(self):
+        bad_page = ("1", uniqlo.PAGE_SIZE)
+        StubApi.bad = {bad_page}
+        with self.assertRaises(Exception):
+            db.add_checkpointed_store(self.store(), "nightly")
+        self.assertEqual(StubApi.requests.count(bad_page), 1)
+        self.assertGreater(db.Checkpoint("Uniqlo", "nightly").count(), 0)
+
+        db.add_checkpointed_store(self.store(), "nightly", resume=True)
+
+        self.assertEqual(StubApi.requests.count(bad_page), 2)
+        with db.SessionLocal() as session:
+            data = session.scalar(select(db.Brand.data).where(db.Brand.alias == "nightly"))
+            ids = [item["productId"] for items, _ in db.iter_snapshot(session, data) for item in items]
+        self.assertEqual(len(ids), 2 * ITEMS_PER_CATEGORY)
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(db.Checkpoint("Uniqlo", "nightly").count(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
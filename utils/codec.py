@@ -0,0 +1,172 @@
+import codecs
+import json
+import zlib
+from pathlib import Path
+from typing import Any, BinaryIO, Iterable, Iterator, Optional
+
+MAGIC = b"OFS"
+"""Prefix marking a packed snapshot. Legacy rows are plain JSON text and never start with it."""
+
+FORMAT_VERSION = 1
+"""Version byte written after `MAGIC`. 1 = minified JSON compressed with zlib."""
+
+MANIFEST_VERSION = 2
+"""Same encoding as `FORMAT_VERSION`, but the value is a snapshot manifest of content hashes rather than the
+    snapshot itself (see `local_database.save_snapshot`)."""
+
+COMPRESSION_LEVEL = 6
+
+CHUNK_SIZE = 64 * 1024
+"""Bytes decompressed or read per step when decoding incrementally."""
+
+
+def pack(obj: Any, version: int = FORMAT_VERSION) -> bytes:
+    """Serializes `obj` as minified JSON, compresses it and prefixes the format marker."""
+    data = json.dumps(obj, separators=(',', ':')).encode()
+    return MAGIC + bytes([version]) + zlib.compress(data, COMPRESSION_LEVEL)
+
+
+class Packer(object):
+    """Packs a JSON array one element at a time, so only the compressed output is held in memory. `finish` returns
+        a value that decodes like `pack(elements)`."""
+    def __init__(self, version: int = FORMAT_VERSION):
+        self._compressor = zlib.compressobj(COMPRESSION_LEVEL)
+        self._chunks = [MAGIC + bytes([version])]
+        self._separator = b'['
+        self.count = 0
+
+    def add(self, obj: Any) -> None:
+        data = json.dumps(obj, separators=(',', ':')).encode()
+        self._chunks.append(self._compressor.compress(self._separator + data))
+        self._separator = b','
+        self.count += 1
+
+    def finish(self) -> bytes:
+        self._chunks.append(self._compressor.compress(b']' if self.count else b'[]'))
+        self._chunks.append(self._compressor.flush())
+        return b''.join(self._chunks)
+
+
+def format_version(data: Optional[bytes | str]) -> int:
+    """Returns the format version of a stored value, 0 for legacy JSON text."""
+    if isinstance(data, bytes) and data.startswith(MAGIC):
+        return data[len(MAGIC)]
+    return 0
+
+
+def unpack(data: Optional[bytes | str]) -> Any:
+    """Decodes a value written by `pack`, or a legacy JSON text row."""
+    if data is None:
+        return None
+    version = format_version(data)
+    if version == 0:
+        return json.loads(data)
+    if version in (FORMAT_VERSION, MANIFEST_VERSION):
+        return json.loads(zlib.decompress(data[len(MAGIC) + 1:]))
+    raise ValueError(f"Unknown snapshot format version {version}.")
+
+
+def iter_json_array(chunks: Iterable[str]) -> Iterator[Any]:
+    """Incrementally decodes a top-level JSON array from text chunks, yielding one element at a time, so that only
+        the element being decoded and an unparsed tail of text are held in memory."""
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer = ''
+    pos = 0
+    eof = False
+    started = False
+    expect_comma = False
+
+    def read_more(size_hint: int = 1):
+        nonlocal buffer, pos, eof
+        buffer = buffer[pos:]
+        pos = 0
+        while not eof and len(buffer) < size_hint:
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
+            else:
+                buffer += chunk
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+            pos += 1
+        if pos == len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of JSON array.")
+            read_more()
+            continue
+
+        if not started:
+            if buffer[pos] != '[':
+                raise ValueError("Expected a JSON array.")
+            started = True
+            pos += 1
+            continue
+        if buffer[pos] == ']':
+            return
+        if expect_comma:
+            if buffer[pos] != ',':
+                raise ValueError(f"Expected ',' or ']' in JSON array, got {buffer[pos]!r}.")
+            expect_comma = False
+            pos += 1
+            continue
+
+        try:
+            element, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            read_more(2 * (len(buffer) - pos) + 1)
+            continue
+        if not eof and (end == len(buffer) or buffer[end] not in ' \t\r\n,]'):
+            # A number cut at the end of a chunk decodes as a shorter number, so wait for its delimiter.
+            read_more(len(buffer) - pos + 1)
+            continue
+        pos = end
+        expect_comma = True
+        yield element
+
+
+def iter_text(data: bytes | str | BinaryIO) -> Iterator[str]:
+    """Yields the JSON text of a stored value in chunks, decompressing packed values on the fly."""
+    if isinstance(data, str):
+        for start in range(0, len(data), CHUNK_SIZE):
+            yield data[start:start + CHUNK_SIZE]
+        return
+
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    if isinstance(data, bytes):
+        if format_version(data) == 0:
+            chunks = (data[start:start + CHUNK_SIZE] for start in range(0, len(data), CHUNK_SIZE))
+        else:
+            chunks = _decompress(data[len(MAGIC) + 1:])
+    else:
+        chunks = iter(lambda: data.read(CHUNK_SIZE), b'')
+    for chunk in chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
+def _decompress(data: bytes) -> Iterator[bytes]:
+    decompressor = zlib.decompressobj()
+    for start in range(0, len(data), CHUNK_SIZE):
+        chunk = data[start:start + CHUNK_SIZE]
+        while chunk:
+            yield decompressor.decompress(chunk, CHUNK_SIZE)
+            chunk = decompressor.unconsumed_tail
+    yield decompressor.flush()
+
+
+def iter_unpack(data: bytes | str | Path | None) -> Iterator[Any]:
+    """Lazily yields the elements of a stored JSON array, from a value written by `pack`, a legacy JSON text row
+        or a JSON file, without decoding the whole array at once."""
+    if data is None:
+        return
+    if isinstance(data, Path):
+        with data.open('rb') as f:
+            yield from iter_json_array(iter_text(f))
+        return
+    if format_version(data) not in (0, FORMAT_VERSION, MANIFEST_VERSION):
+        raise ValueError(f"Unknown snapshot format version {format_version(data)}.")
+    yield from iter_json_array(iter_text(data))
@@ -1,25 +1,57 @@
-import sqlalchemy as sa
+from functools import lru_cache
 from pathlib import Path
+from typing import Callable
 
-from dotenv import dotenv_values
-from sqlalchemy import Engine, create_engine, URL
+from sqlalchemy import Engine, create_engine, event, URL
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.orm import sessionmaker, Session
 
 
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64 * 1024,
+    "busy_timeout": 30_000,
+    "temp_store": "MEMORY",
+}
+"""Applied to every local connection. WAL lets `show` commands read while a scrape is writing, NORMAL sync is safe
+    under WAL and only fsyncs at checkpoints, cache_size is in KiB when negative, and busy_timeout makes a second
+    writer wait for the lock in milliseconds instead of failing with "database is locked"."""
+
+LOCAL_POOL_SIZE = 5
+
+
+def configure_sqlite(engine: Engine, pragmas: dict = None) -> Engine:
+    """Sets `pragmas`, `SQLITE_PRAGMAS` by default, on every new connection of a SQLite engine."""
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return engine
+
+
+@lru_cache(maxsize=None)
 def get_local_engine():
-    """Gets SQLAlchemy engine to connect to local database."""
+    """Gets SQLAlchemy engine to connect to local database. Connections are pooled and tuned by `configure_sqlite`."""
     parent_dir = Path(__file__).resolve().parent.parent
     file_path = parent_dir / 'src' / 'local_settings' / 'local_settings.sqlite3'
     db_url = "sqlite:///" + str(file_path)
-    engine: Engine = create_engine(db_url)
-    return engine
-
-
-SessionLocal: sessionmaker[Session] = sessionmaker(bind=get_local_engine())
+    engine: Engine = create_engine(db_url, poolclass=QueuePool, pool_size=LOCAL_POOL_SIZE, max_overflow=10,
+                                   connect_args={"timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000,
+                                                 "check_same_thread": False})
+    return configure_sqlite(engine)
 
 
+@lru_cache(maxsize=None)
 def get_remote_engine():
     """Gets SQLAlchemy engine to connect to remote database."""
+    from dotenv import dotenv_values
+
     env_file = Path(__file__).parent.parent / '.env'
     config = dotenv_values(env_file)
 
@@ -36,4 +68,26 @@ def get_remote_engine():
     return create_engine(url_object, echo=False)
 
 
-SessionRemote: sessionmaker[Session] = sessionmaker(bind=get_remote_engine())
+class LazySessionmaker(object):
+    """Behaves like a `sessionmaker` but only creates its engine the first time a session is requested, so that
+        importing a module never reads `.env` or connects to a database."""
+    def __init__(self, get_engine: Callable[[], Engine]):
+        self.get_engine = get_engine
+        self._sessionmaker: sessionmaker[Session] | None = None
+
+    @property
+    def sessionmaker(self) -> sessionmaker[Session]:
+        if self._sessionmaker is None:
+            self._sessionmaker = sessionmaker(bind=self.get_engine())
+        return self._sessionmaker
+
+    def __call__(self, **kwargs) -> Session:
+        return self.sessionmaker(**kwargs)
+
+    def begin(self):
+        return self.sessionmaker.begin()
+
+
+SessionLocal = LazySessionmaker(get_local_engine)
+
+SessionRemote = LazySessionmaker(get_remote_engine)
@@ -1,17 +1,69 @@
+from __future__ import annotations
+
+import importlib
+from functools import lru_cache
+from importlib.metadata import EntryPoint, entry_points
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, Type
+
+if TYPE_CHECKING:
+    from src.models.store import Store
+
+ENTRY_POINT_GROUP = "outflick.stores"
+"""Package entry point group that third-party parsers can register under, e.g.
+    `Zara = "outflick_zara.zara:Zara"`."""
+
+STORES_DIR = Path(__file__).parent.parent / 'src' / 'Stores'
+
+_registry: Dict[str, Type[Store]] = {}
+"""Parser classes that have already been imported, by brand name."""
+
+
+def register_store(name: str = None) -> Callable[[Type[Store]], Type[Store]]:
+    """Class decorator that registers a `Store` parser under `name`, or the class name by default."""
+    def decorator(cls: Type[Store]) -> Type[Store]:
+        _registry[name or cls.__name__] = cls
+        return cls
+    return decorator
+
+
+@lru_cache(maxsize=None)
+def get_entry_points() -> Dict[str, EntryPoint]:
+    """Parsers advertised by installed packages. Only their metadata is read, nothing is imported."""
+    return {ep.name: ep for ep in entry_points(group=ENTRY_POINT_GROUP)}
+
+
+def list_stores() -> List[str]:
+    """Names of every known parser, whether or not it has been imported yet."""
+    local = [item.name for item in STORES_DIR.iterdir() if item.is_dir() and not item.name.startswith('_')]
+    return sorted(set(local) | set(get_entry_points()) | set(_registry))
+
+
+def get_store_class(brand: str) -> Type[Store]:
+    """Gets the Parser's class from brand name, importing its module the first time it is requested.
+
+    Lookup order: parsers that are already registered, then package entry points, then the
+    `src/Stores/<Brand>/<brand>.py` module, whose class registers itself with `@register_store`.
+    """
+    if brand in _registry:
+        return _registry[brand]
+
+    entry_point = get_entry_points().get(brand)
+    if entry_point is not None:
+        return _registry.setdefault(brand, entry_point.load())
+
+    if brand.isidentifier() and (STORES_DIR / brand / f'{brand.lower()}.py').is_file():
+        importlib.import_module(f'src.Stores.{brand}.{brand.lower()}')
+        if brand in _registry:
+            return _registry[brand]
 
-from src.Stores.Uniqlo.uniqlo import Uniqlo
-# from src.Stores.Zara.zara2 import Zara
-from src.models.store import Store
+    raise Exception(f'Brand {brand} does not exist. Please add this store\'s parser to the src/Stores folder. '
+                    f'Available stores: {", ".join(list_stores())}.')
 
 
 def get_store_obj(brand: str) -> Store:
-    """Gets the Parser's class from brand name if file location is setup correctly."""
-    store_dir = Path(__file__).parent.parent / 'src' / 'Stores'
-    stores = [item.name for item in store_dir.iterdir() if item.is_dir()]
-    if brand not in stores:
-        raise Exception(f'Brand {brand} does not exist. Please add this store\'s parser to the src/Stores folder.')
-    store_obj: Store = globals()[brand]()
+    """Gets a new instance of the Parser registered for the brand name."""
+    store_obj: Store = get_store_class(brand)()
     return store_obj
 
 
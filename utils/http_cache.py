@@ -0,0 +1,157 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, NamedTuple, Optional
+from urllib.parse import urlencode
+
+import requests
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / 'src' / 'local_settings' / 'http_cache'
+
+
+class CacheMiss(Exception):
+    """Raised in offline mode when a request has never been cached."""
+
+
+class CachedResponse(NamedTuple):
+    """A cached response body together with the validators needed to revalidate it."""
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    stored_at: float
+
+
+class ResponseCache(object):
+    """On-disk cache of GET responses keyed by URL + query string.
+
+    Each entry is one gzip file holding a JSON metadata line followed by the raw body. An entry younger than
+    `ttl` seconds is served without touching the network, an older one is revalidated with
+    `If-None-Match`/`If-Modified-Since` when the server sent an ETag or Last-Modified header. `evict` drops
+    entries older than `max_stale` seconds and then the oldest entries until the cache fits in `max_bytes`.
+    With `offline=True` every request is answered from disk and uncached requests raise `CacheMiss`.
+    """
+    def __init__(self, directory: Path = DEFAULT_CACHE_DIR, ttl: float = 60 * 60, max_stale: float = 7 * 24 * 60 * 60,
+                 max_bytes: int = 256 * 1024 * 1024, offline: bool = False):
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_bytes = max_bytes
+        self.offline = offline
+
+    @staticmethod
+    def key(url: str, params: dict = None) -> str:
+        """Hashes the URL and its sorted query parameters into the entry's file name."""
+        query = urlencode(sorted((params or {}).items()))
+        return hashlib.sha256(f"{url}?{query}".encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.gz"
+
+    def get(self, url: str, params: dict = None) -> Optional[CachedResponse]:
+        """Returns the cached response for the request, or None if there isn't one."""
+        path = self._path(self.key(url, params))
+        try:
+            stored_at = path.stat().st_mtime
+            with gzip.open(path, 'rb') as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        return CachedResponse(body, meta.get('etag'), meta.get('last_modified'), stored_at)
+
+    def put(self, url: str, params: dict, body: bytes, etag: str = None, last_modified: str = None) -> None:
+        """Stores a response body, replacing any previous entry for the same request."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(self.key(url, params))
+        meta = json.dumps({'url': url, 'params': params, 'etag': etag, 'last_modified': last_modified})
+        tmp_path = path.with_suffix(f".{os.getpid()}.{id(body)}.tmp")
+        with gzip.open(tmp_path, 'wb') as f:
+            f.write(meta.encode() + b"\n")
+            f.write(body)
+        os.replace(tmp_path, path)
+
+    def touch(self, url: str, params: dict = None) -> None:
+        """Marks an entry as freshly validated."""
+        os.utime(self._path(self.key(url, params)))
+
+    def discard(self, url: str, params: dict = None) -> None:
+        """Removes the entry for the request, if there is one."""
+        self._path(self.key(url, params)).unlink(missing_ok=True)
+
+    def fetch(self, session: requests.Session, url: str, params: dict = None, timeout: float = 30,
+              decode: Callable[[bytes], Any] = None) -> Any:
+        """Returns the response body for a GET request, going to the network only when the cache can't answer.
+
+        With `decode`, returns `decode(body)` instead, and only bodies it accepts are cached: a fresh body it raises
+        on is never stored, and a cached one it raises on is dropped and fetched again (or the error re-raised when
+        offline), so that a bad 200 response can't be replayed until it expires.
+        """
+        decode = decode or (lambda body: body)
+        cached = self.get(url, params)
+        if self.offline and cached is None:
+            raise CacheMiss(f"No cached response for {url} with {params}.")
+        if cached is not None and (self.offline or time.time() - cached.stored_at < self.ttl):
+            try:
+                return decode(cached.body)
+            except Exception:
+                self.discard(url, params)
+                if self.offline:
+                    raise
+                cached = None
+
+        headers = {}
+        if cached is not None and cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached is not None and cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+
+        response = session.get(url, params=params, headers=headers, timeout=timeout)
+        if response.status_code == 304 and cached is not None:
+            try:
+                value = decode(cached.body)
+            except Exception:
+                self.discard(url, params)
+                raise
+            self.touch(url, params)
+            return value
+        response.raise_for_status()
+
+        value = decode(response.content)
+        self.put(url, params, response.content, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return value
+
+    def fetch_json(self, session: requests.Session, url: str, params: dict = None, timeout: float = 30) -> Any:
+        return self.fetch(session, url, params=params, timeout=timeout, decode=json.loads)
+
+    def evict(self) -> int:
+        """Removes entries older than `max_stale`, then the oldest ones until the cache fits in `max_bytes`.
+            Returns the number of removed entries."""
+        if not self.directory.exists():
+            return 0
+        entries = []
+        for path in self.directory.glob("*.gz"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        now = time.time()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for stored_at, size, path in entries:
+            if now - stored_at <= self.max_stale and total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self) -> None:
+        """Removes every cached entry."""
+        for path in self.directory.glob("*.gz"):
+            path.unlink(missing_ok=True)
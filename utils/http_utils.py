@@ -0,0 +1,92 @@
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.http_cache import ResponseCache
+from utils.metrics import metrics
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+DEFAULT_MAX_WORKERS = 8
+"""Default number of requests that are allowed to be in flight at once."""
+
+
+def get_session(max_workers: int = DEFAULT_MAX_WORKERS, headers: dict = None) -> requests.Session:
+    """Gets a keep-alive `requests.Session` whose connection pool can serve `max_workers` threads at once."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if headers is not None:
+        session.headers.update(headers)
+    return session
+
+
+def fetch_paged(fetch: Callable[[T], R], tasks: Iterable[T], next_task: Callable[[T, R], Optional[T]],
+                max_workers: int = DEFAULT_MAX_WORKERS) -> Iterator[Tuple[T, R, Optional[T]]]:
+    """Lazily yields `(task, fetch(task), follow_up)` with at most `max_workers` fetches in flight at once.
+
+    After each result `next_task(task, result)` is called once and may return a follow-up task (e.g. the next page),
+    which is queued right away and yielded as `follow_up`. Each task of `tasks` starts a chain of follow-ups, and
+    results come back chain by chain, in order within a chain, whatever `max_workers` is; the results of chains that
+    finish ahead of the one being yielded are buffered until it's their turn.
+    """
+    tasks = iter(tasks)
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        in_flight = deque()
+        buffers: Dict[int, deque] = {}
+        finished = set()
+        started = 0
+        current = 0
+
+        def fill():
+            nonlocal started
+            while len(in_flight) < max(max_workers, 1):
+                task = next(tasks, None)
+                if task is None:
+                    return
+                buffers[started] = deque()
+                in_flight.append((started, task, executor.submit(fetch, task)))
+                started += 1
+
+        fill()
+        while in_flight:
+            chain, task, future = in_flight.popleft()
+            result = future.result()
+            follow_up = next_task(task, result)
+            if follow_up is not None:
+                in_flight.append((chain, follow_up, executor.submit(fetch, follow_up)))
+            else:
+                finished.add(chain)
+            buffers[chain].append((task, result, follow_up))
+            fill()
+            while current in buffers:
+                while buffers[current]:
+                    yield buffers[current].popleft()
+                if current not in finished:
+                    break
+                del buffers[current]
+                current += 1
+
+
+def get_json(session: requests.Session, url: str, params: dict = None, timeout: float = 30,
+             cache: ResponseCache = None, decode: Callable[[Any], Any] = None) -> Any:
+    """GETs `url` through `session` and returns the decoded JSON body, raising on HTTP errors. Goes through
+        `cache` when one is given. `decode`, if given, is applied to the JSON and its result returned; since the
+        cache only keeps bodies that decode, it should raise on payloads that aren't usable."""
+    with metrics.stage('http') as stage:
+        def decode_body(body: bytes) -> Any:
+            stage.add(bytes=len(body))
+            value = json.loads(body)
+            return value if decode is None else decode(value)
+
+        if cache is not None:
+            return cache.fetch(session, url, params=params, timeout=timeout, decode=decode_body)
+        response = session.get(url, params=params, timeout=timeout)
+        response.raise_for_status()
+        return decode_body(response.content)
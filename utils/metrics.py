@@ -0,0 +1,172 @@
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+
+
+class Stage(object):
+    """Running totals for every run of one named stage."""
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.items = 0
+        self.bytes = 0
+        self.round_trips = 0
+        self.peak_memory: int | None = None
+        self._lock = threading.Lock()
+
+    def add(self, items: int = 0, bytes: int = 0, round_trips: int = 0, seconds: float = 0.0, calls: int = 0):
+        """Adds to the totals. Safe to call from worker threads."""
+        with self._lock:
+            self.items += items
+            self.bytes += bytes
+            self.round_trips += round_trips
+            self.seconds += seconds
+            self.calls += calls
+
+    def add_peak(self, peak: int) -> None:
+        with self._lock:
+            self.peak_memory = peak if self.peak_memory is None else max(self.peak_memory, peak)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"stage": self.name, "calls": self.calls, "seconds": round(self.seconds, 4), "items": self.items,
+                "bytes": self.bytes, "round_trips": self.round_trips, "peak_memory": self.peak_memory}
+
+
+class NullStage(Stage):
+    """Stage handed out while metrics are disabled. Discards everything added to it."""
+    def add(self, items: int = 0, bytes: int = 0, round_trips: int = 0, seconds: float = 0.0, calls: int = 0):
+        pass
+
+    def add_peak(self, peak: int) -> None:
+        pass
+
+
+NULL_STAGE = NullStage("")
+"""Shared by every disabled stage, so that instrumented code allocates nothing while profiling is off."""
+
+
+class Metrics(object):
+    """Collects per-stage durations, item counts, bytes and database round trips for `--profile`. Does nothing
+        until `enable` is called, so instrumented code costs next to nothing in normal runs.
+
+    Stages nest and their totals are inclusive, e.g. `commit_catalog` contains `commit_products`. Stages entered from
+        worker threads, like `http`, add up the time spent in every thread. With `memory`, the peak traced Python
+        allocation of each stage run on the main thread is recorded too, at a large cost in speed."""
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self.stages: Dict[str, Stage] = {}
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._peaks: List[int] = []
+        """Peak traced memory of each active main-thread stage, innermost last."""
+        self._overall_peak = 0
+
+    def enable(self, memory: bool = False) -> None:
+        """Starts collecting, and counts every statement sent through a SQLAlchemy engine as a round trip of the
+            stages active in the calling thread. `memory` also starts `tracemalloc` to track peak allocations."""
+        from sqlalchemy import Engine, event
+
+        if not self.enabled:
+            event.listen(Engine, "before_cursor_execute", self._on_execute)
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.enabled = True
+        self.memory = memory
+        self.started = time.perf_counter()
+
+    def get(self, name: str) -> Stage:
+        with self._lock:
+            if name not in self.stages:
+                self.stages[name] = Stage(name)
+            return self.stages[name]
+
+    @property
+    def _active(self) -> List[Stage]:
+        if not hasattr(self._local, "active"):
+            self._local.active = []
+        return self._local.active
+
+    @contextmanager
+    def _timed(self, name: str, calls: int) -> Iterator[Stage]:
+        if not self.enabled:
+            yield NULL_STAGE
+            return
+        stage = self.get(name)
+        self._active.append(stage)
+        track_memory = self.memory and threading.current_thread() is threading.main_thread()
+        if track_memory:
+            self._enter_peak()
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            self._active.pop()
+            stage.add(seconds=time.perf_counter() - start, calls=calls)
+            if track_memory:
+                stage.add_peak(self._exit_peak())
+
+    def _enter_peak(self) -> None:
+        """`tracemalloc` has a single peak counter, so before resetting it for a nested stage the peak reached so
+            far is folded into the enclosing stage's frame."""
+        current, peak = tracemalloc.get_traced_memory()
+        self._overall_peak = max(self._overall_peak, peak)
+        if self._peaks:
+            self._peaks[-1] = max(self._peaks[-1], peak)
+        tracemalloc.reset_peak()
+        self._peaks.append(current)
+
+    def _exit_peak(self) -> int:
+        peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+        if self._peaks:
+            self._peaks[-1] = max(self._peaks[-1], peak)
+        return peak
+
+    def stage(self, name: str):
+        """Context manager that times one run of stage `name` and yields its `Stage`, to `add` items or bytes to."""
+        if not self.enabled:
+            return nullcontext(NULL_STAGE)
+        return self._timed(name, calls=1)
+
+    def iter_stage(self, name: str, iterable: Iterable[T], count: Callable[[T], int] = None) -> Iterable[T]:
+        """Passes `iterable` through, timing only the time spent producing each element under stage `name`, and
+            counting `count(element)` items per element, or one. Returns `iterable` itself while disabled."""
+        if not self.enabled:
+            return iterable
+        return self._iter_timed(name, iterable, count)
+
+    def _iter_timed(self, name: str, iterable: Iterable[T], count: Callable[[T], int] = None) -> Iterator[T]:
+        iterator = iter(iterable)
+        self.get(name).add(calls=1)
+        while True:
+            with self._timed(name, calls=0) as stage:
+                try:
+                    element = next(iterator)
+                except StopIteration:
+                    return
+                stage.add(items=1 if count is None else count(element))
+            yield element
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        if not self.enabled:
+            return
+        for stage in set(self._active):
+            stage.add(round_trips=1)
+
+    def report(self) -> Dict[str, Any]:
+        """Returns the wall time since `enable` and the totals of every stage, in the order they first ran."""
+        report = {"wall_seconds": round(time.perf_counter() - self.started, 4),
+                  "stages": [stage.as_dict() for stage in self.stages.values()]}
+        if self.memory:
+            report["peak_memory"] = max(self._overall_peak, tracemalloc.get_traced_memory()[1])
+        return report
+
+
+metrics = Metrics()
+"""Process-wide metrics that the instrumented stages report to."""
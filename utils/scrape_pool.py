@@ -0,0 +1,55 @@
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator, List, NamedTuple, Optional
+
+from utils.codec import pack
+
+
+class ScrapeResult(NamedTuple):
+    """What a worker process sends back for one brand: its raw pages and parsed products, packed by
+        `utils.codec.pack` so that only compact bytes cross the process boundary."""
+    brand: str
+    raw: Optional[bytes] = None
+    products: Optional[bytes] = None
+    items: int = 0
+    product_count: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+def scrape_store(brand: str, offline: bool = False, max_workers: int = 8, parse: bool = True,
+                 validation: str = 'fast') -> ScrapeResult:
+    """Fetches, and optionally parses, one brand. Runs in a worker process, so any error is returned rather than
+        raised."""
+    from utils.get_parser import get_store_obj
+
+    start = time.perf_counter()
+    try:
+        store = get_store_obj(brand)
+        store.validation = validation
+        pages = list(store.iter_data(local_data=offline, max_workers=max_workers))
+        products = None
+        if parse:
+            store.raw_data = pages
+            products = store.dump_products(store.iter_products())
+        return ScrapeResult(brand, raw=pack(pages), products=None if products is None else pack(products),
+                            items=sum(len(items) for items, _ in pages),
+                            product_count=0 if products is None else len(products),
+                            seconds=time.perf_counter() - start)
+    except Exception as e:
+        traceback.print_exc()
+        return ScrapeResult(brand, seconds=time.perf_counter() - start, error=f"{type(e).__name__}: {e}")
+
+
+def scrape_stores(brands: List[str], processes: int = None, offline: bool = False, max_workers: int = 8,
+                  parse: bool = True, validation: str = 'fast') -> Iterator[ScrapeResult]:
+    """Scrapes every brand in its own worker process, at most `processes` at a time (all at once by default, since
+        the work is mostly waiting on the network), and yields each result as soon as it is ready so that a single
+        writer can store it while the others are still running."""
+    processes = processes or len(brands)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [executor.submit(scrape_store, brand, offline=offline, max_workers=max_workers, parse=parse,
+                                   validation=validation) for brand in brands]
+        for future in as_completed(futures):
+            yield future.result()